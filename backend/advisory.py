@@ -0,0 +1,97 @@
+"""Dependency-graph executor behind the composite field advisory endpoint.
+
+An advisory is a few stages (soil recommendation, fertilizer, yield, weather)
+where some need another stage's result. Every stage starts as soon as the
+stages it depends on have finished, so independent ones overlap and the
+request takes about as long as its slowest chain rather than the sum.
+
+A stage that raises or returns an {"error": ...} dict fails on its own: the
+stages that depend on it are skipped and the rest still run. Each stage's
+start offset and duration are reported alongside the results.
+"""
+import asyncio
+import time
+
+from metrics import span
+
+# Soil recommender labels -> Crop values known to the yield model. Fruits,
+# coffee and coconut have no yield data.
+YIELD_CROP_NAMES = {
+    "rice": "Rice",
+    "maize": "Maize",
+    "chickpea": "Gram",
+    "kidneybeans": "Peas & beans (Pulses)",
+    "pigeonpeas": "Arhar/Tur",
+    "mothbeans": "Other Kharif pulses",
+    "mungbean": "Moong(Green Gram)",
+    "blackgram": "Urad",
+    "lentil": "Masoor",
+    "cotton": "Cotton(lint)",
+    "jute": "Jute",
+    "banana": "Banana",
+}
+
+
+class Stage:
+    """A named async step; run receives the results of the stages in after as keyword arguments."""
+
+    def __init__(self, name, run, after=()):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+
+
+def _elapsed_ms(start, end):
+    return round((end - start) * 1000, 2)
+
+
+async def run_stages(stages):
+    """Run stages concurrently in dependency order; returns (results by name, timings).
+
+    Stages must be listed after the stages they depend on.
+    """
+    start = time.perf_counter()
+    tasks = {}
+    timings = {}
+
+    async def execute(stage):
+        inputs = {}
+        for name in stage.after:
+            status, result = await tasks[name]
+            if status != "ok":
+                timings[stage.name] = {"status": "skipped"}
+                return "skipped", {"error": f"Skipped because stage '{name}' did not complete."}
+            inputs[name] = result
+        began = time.perf_counter()
+        try:
+            with span(stage.name):
+                result = await stage.run(**inputs)
+            status = "error" if isinstance(result, dict) and "error" in result else "ok"
+        except Exception as e:
+            status, result = "error", {"error": str(e)}
+        finished = time.perf_counter()
+        timings[stage.name] = {"status": status, "start_ms": _elapsed_ms(start, began),
+                               "duration_ms": _elapsed_ms(began, finished)}
+        return status, result
+
+    seen = set()
+    for stage in stages:
+        if stage.name in seen:
+            raise ValueError(f"Duplicate stage '{stage.name}'.")
+        missing = [name for name in stage.after if name not in seen]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown or later stages: {missing}")
+        seen.add(stage.name)
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(execute(stage))
+    outcomes = await asyncio.gather(*tasks.values())
+
+    total_ms = _elapsed_ms(start, time.perf_counter())
+    results = {name: result for name, (_, result) in zip(tasks, outcomes)}
+    summary = {
+        "stages": {name: timings[name] for name in tasks},
+        "total_ms": total_ms,
+        # What running the stages one after another would have cost
+        "sequential_ms": round(sum(t.get("duration_ms", 0) for t in timings.values()), 2),
+    }
+    return results, summary
@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import os
+
+from pydantic import ValidationError
+
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "1024"))
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "100000"))
+
+
+def format_validation_error(error):
+    """Flatten a pydantic ValidationError into one readable line."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+
+
+def csv_rows(lines):
+    """Row dicts keyed by header from an iterable of CSV text lines (e.g. an open file)."""
+    for row in csv.DictReader(lines):
+        # Blank cells become missing fields so validation reports them clearly
+        yield {key.strip(): value.strip() for key, value in row.items()
+               if key is not None and value is not None and value.strip() != ""}
+
+
+def parse_csv(content):
+    """Parse an uploaded CSV (bytes) into a list of row dicts keyed by header.
+
+    Raises ValueError for content that is not UTF-8 text or not valid CSV.
+    """
+    try:
+        return list(csv_rows(io.StringIO(content.decode("utf-8-sig"))))
+    except UnicodeDecodeError:
+        raise ValueError("CSV upload must be UTF-8 encoded text.")
+    except csv.Error as e:
+        raise ValueError(f"Could not parse CSV: {e}")
+
+
+def validate_rows(rows, schema):
+    """Validate each row against schema, keeping track of the input index.
+
+    Returns (valid, errors) where valid is a list of (index, model instance)
+    and errors maps index -> error message.
+    """
+    valid, errors = [], {}
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[index] = "Row must be a JSON object"
+            continue
+        try:
+            valid.append((index, schema(**row)))
+        except ValidationError as e:
+            errors[index] = format_validation_error(e)
+    return valid, errors
+
+
+def iter_batch(rows, schema, predict_chunk, chunk_size=BATCH_CHUNK_SIZE):
+    """Validate and predict rows chunk by chunk, yielding each chunk's results in input order.
+
+    predict_chunk receives the validated records (dicts) of one chunk and
+    returns one result dict per row. A failure inside a chunk is reported on
+    each of its rows. Only one chunk of results is held at a time, so callers
+    can stream them out as they are produced.
+    """
+    for start in range(0, len(rows), chunk_size):
+        valid, errors = validate_rows(rows[start:start + chunk_size], schema)
+        results = {start + index: {"index": start + index, "error": message} for index, message in errors.items()}
+        if valid:
+            records = [item.dict() for _, item in valid]
+            try:
+                chunk_results = predict_chunk(records)
+            except Exception as e:
+                chunk_results = [{"error": str(e)}] * len(valid)
+            for (index, _), result in zip(valid, chunk_results):
+                results[start + index] = {"index": start + index, **result}
+        yield [results[index] for index in sorted(results)]
+
+
+def check_batch_size(rows):
+    """Return an error dict if the batch is over BATCH_MAX_ROWS, else None."""
+    if len(rows) > BATCH_MAX_ROWS:
+        return {"error": f"Batch too large: {len(rows)} rows (max {BATCH_MAX_ROWS})."}
+    return None
+
+
+def summarize(results):
+    return {
+        "results": results,
+        "count": len(results),
+        "error_count": sum(1 for result in results if "error" in result),
+    }
+
+
+def run_batch(rows, schema, predict_chunk, chunk_size=BATCH_CHUNK_SIZE):
+    """Validate rows, predict valid ones chunk by chunk and return results in input order."""
+    too_large = check_batch_size(rows)
+    if too_large:
+        return too_large
+    return summarize([result for chunk in iter_batch(rows, schema, predict_chunk, chunk_size) for result in chunk])
+
+
+def ndjson(item):
+    return json.dumps(item) + "\n"
+
+
+def done_line(count, error_count):
+    """Last line of every NDJSON stream, so clients can tell a complete stream from a cut one."""
+    return ndjson({"done": True, "count": count, "error_count": error_count})
@@ -0,0 +1,282 @@
+"""Load-test harness for the CROPIX API.
+
+Starts the API with uvicorn (or targets --url), serves the weather endpoints
+from a local stub OpenWeather server, drives every endpoint at the given
+concurrency and writes req/s, p50/p95/p99 latency, server RSS and CPU time
+per endpoint as JSON so runs can be compared between commits.
+
+    python benchmark.py --concurrency 16 --requests 500 --output bench.json
+    python benchmark.py --compare before.json --output after.json
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import numpy as np
+
+LEAF_IMAGE_PATH = "Leaf_img.jpg"
+CROPS = ["Rice", "Wheat", "Maize", "Arhar/Tur", "Moong(Green Gram)", "Sugarcane"]
+SEASONS = ["Kharif     ", "Rabi       ", "Whole Year "]
+MARKET_CROPS = ["Soybean", "Wheat", "Rice", "Gram", "Maize", "Arhar", "Mustard", "Masoor"]
+CITIES = ["Bhopal", "Indore", "Jabalpur", "Gwalior", "Ujjain"]
+
+
+# --- Stub OpenWeather server ---
+
+class StubOpenWeatherHandler(BaseHTTPRequestHandler):
+    latency = 0.0  # Seconds of simulated upstream latency
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/geo/1.0/direct":
+            seed = sum(map(ord, query.get("q", [""])[0]))
+            body = [{"name": query.get("q", [""])[0], "lat": 20 + seed % 10, "lon": 75 + seed % 7}]
+        elif url.path == "/data/2.5/forecast":
+            start = int(time.time()) // 10800 * 10800
+            body = {
+                "city": {"timezone": 19800},
+                "list": [
+                    {
+                        "dt": start + i * 10800,
+                        "main": {"temp_min": 20 + i % 8, "temp_max": 28 + i % 8, "humidity": 40 + i % 30},
+                        "pop": (i % 5) / 5,
+                        "weather": [{"description": "scattered clouds"}],
+                    }
+                    for i in range(40)
+                ],
+            }
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency=0.0):
+    StubOpenWeatherHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenWeatherHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- Request payloads ---
+
+def make_payloads(vary):
+    """Return {endpoint: payload factory}. With vary, inputs change per request so caches miss."""
+    rng = random.Random(0)
+    jitter = (lambda: rng.uniform(0.9, 1.1)) if vary else (lambda: 1.0)
+    with open(LEAF_IMAGE_PATH, "rb") as f:
+        leaf = f.read()
+    uploads = itertools.count()
+
+    def leaf_base64():
+        # Bytes after the JPEG end marker are ignored by the decoder but change the content hash,
+        # so the disease dedup cache misses and the CNN is measured, not the cache
+        return base64.b64encode(leaf + next(uploads).to_bytes(8, "big") if vary else leaf).decode()
+
+    return {
+        "/predict_crop_yield/": lambda: {
+            "Crop": rng.choice(CROPS), "Season": rng.choice(SEASONS), "Area": 1200 * jitter(),
+            "Fertilizer": 110000 * jitter(), "Crop_Year": 2020, "Pesticide": 350 * jitter(),
+            "Annual_Rainfall": 1100 * jitter(),
+        },
+        "/recommend_soil_crop/": lambda: {
+            "N": 90 * jitter(), "P": 42 * jitter(), "K": 43 * jitter(), "temperature": 20.8 * jitter(),
+            "humidity": 82 * jitter(), "ph": 6.5 * jitter(), "rainfall": 202 * jitter(),
+        },
+        "/recommend_fertilizer/": lambda: {
+            "Crop": rng.choice(CROPS), "Current_N": 40 * jitter(), "Current_P": 20 * jitter(),
+            "Current_K": 30 * jitter(),
+        },
+        "/detect_disease/": lambda: {"image_base64": leaf_base64()},
+        "/forecast_market_prices/": lambda: {
+            "crop_name": rng.choice(MARKET_CROPS), "weeks_to_forecast": rng.randint(1, 12),
+        },
+        "/weather_forecast/": lambda: {"city": rng.choice(CITIES), "days": 5},
+        "/weather_forecast_lstm/": lambda: {"city": rng.choice(CITIES), "days": 5},
+    }
+
+
+# --- Server process stats (Linux /proc) ---
+
+def process_stats(pid):
+    """Return (rss_mb, cpu_seconds) for pid, or (None, None) if /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        return rss_kb / 1024, cpu_seconds
+    except (OSError, StopIteration, ValueError):
+        return None, None
+
+
+# --- Load generation ---
+
+async def run_endpoint(client, endpoint, factory, concurrency, total):
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            payload = factory()
+            start = time.perf_counter()
+            try:
+                response = await client.post(endpoint, json=payload)
+                failed = response.status_code != 200 or "error" in response.json()
+            except (httpx.HTTPError, ValueError):
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "req_per_s": round(total / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+async def run_benchmark(args, server_pid):
+    payloads = make_payloads(vary=not args.no_vary)
+    endpoints = args.endpoints or list(payloads)
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        for endpoint in endpoints:
+            factory = payloads[endpoint]
+            # Warm-up: loads the model / fills pools so it is not charged to the measurement
+            for _ in range(args.warmup):
+                await client.post(endpoint, json=factory())
+            rss_before, cpu_before = process_stats(server_pid) if server_pid else (None, None)
+            result = await run_endpoint(client, endpoint, factory, args.concurrency, args.requests)
+            rss_after, cpu_after = process_stats(server_pid) if server_pid else (None, None)
+            result["server_rss_mb"] = round(rss_after, 1) if rss_after is not None else None
+            result["server_cpu_seconds"] = (
+                round(cpu_after - cpu_before, 3) if cpu_after is not None and cpu_before is not None else None)
+            results[endpoint] = result
+            print(f"{endpoint:28s} {result['req_per_s']:9.1f} req/s  p50 {result['p50_ms']:8.2f} ms  "
+                  f"p99 {result['p99_ms']:8.2f} ms  errors {result['errors']}")
+    return results
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"API at {url} did not become ready in {timeout}s")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path, current):
+    with open(previous_path) as f:
+        previous = json.load(f)["endpoints"]
+    print(f"\nChange vs {previous_path}:")
+    for endpoint, result in current.items():
+        if endpoint not in previous:
+            continue
+        before = previous[endpoint]
+        rps = (result["req_per_s"] / before["req_per_s"] - 1) * 100 if before["req_per_s"] else 0.0
+        p99 = (result["p99_ms"] / before["p99_ms"] - 1) * 100 if before["p99_ms"] else 0.0
+        print(f"{endpoint:28s} req/s {rps:+7.1f}%  p99 {p99:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every CROPIX endpoint.")
+    parser.add_argument("--url", help="Benchmark an already running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--endpoints", nargs="*", help="Subset of endpoints (default: all)")
+    parser.add_argument("--no-vary", action="store_true", help="Repeat identical inputs (measures caches)")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated OpenWeather latency")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to diff against")
+    args = parser.parse_args()
+
+    stub = start_stub_server(args.stub_latency_ms / 1000)
+    server = None
+    if args.url is None:
+        env = {
+            **os.environ,
+            "OPENWEATHER_BASE_URL": f"http://127.0.0.1:{stub.server_address[1]}",
+            "WEATHER_API_KEY": os.environ.get("WEATHER_API_KEY", "benchmark"),
+        }
+        if not args.no_vary:
+            env["DISEASE_DEDUP_MODE"] = "off"  # Perceptual dedup would still match the varied uploads
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            env=env,
+        )
+        args.url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_ready(args.url, timeout=300)
+        results = asyncio.run(run_benchmark(args, server.pid if server else None))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        stub.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency, "requests": args.requests, "vary_inputs": not args.no_vary,
+            "stub_latency_ms": args.stub_latency_ms, "cpu_count": os.cpu_count(),
+        },
+        "endpoints": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
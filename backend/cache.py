@@ -0,0 +1,248 @@
+import asyncio
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory").lower()  # memory | redis | none
+RESULT_CACHE_URL = os.getenv("RESULT_CACHE_URL", "redis://localhost:6379/0")
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a per-entry TTL."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryBackend:
+    """Per-process LRU/TTL backend."""
+
+    name = "memory"
+    blocking = False  # Dict lookups under a lock: cheap enough for the event loop
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self._cache = TTLCache(max_entries)
+
+    def get(self, namespace, key):
+        return self._cache.get((namespace, key))
+
+    def set(self, namespace, key, value, ttl):
+        self._cache.set((namespace, key), value, ttl)
+
+    def invalidate(self, namespace):
+        self._cache.discard_where(lambda cache_key: cache_key[0] == namespace)
+
+    def size(self):
+        return len(self._cache)
+
+
+class RedisBackend:
+    """Backend for any Redis-compatible client (get / set(ex=) / scan_iter / delete).
+
+    Values are stored as JSON, so every worker process shares one cache. The
+    client can be an in-process stand-in exposing the same methods.
+    """
+
+    name = "redis"
+    blocking = True  # Each call is a network round trip, so ResultCache runs it in a thread
+
+    def __init__(self, client, prefix="cropix:result:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, namespace, key):
+        raw = self.client.get(f"{self.prefix}{namespace}:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace, key, value, ttl):
+        self.client.set(f"{self.prefix}{namespace}:{key}", json.dumps(value), ex=max(1, int(ttl)))
+
+    def invalidate(self, namespace):
+        # Keys embed the model version, so stale ones can never be hit; this just frees memory
+        keys = list(self.client.scan_iter(match=f"{self.prefix}{namespace}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return None
+
+
+class InProcessRedis:
+    """Dict-backed stand-in for a Redis client, covering the calls RedisBackend makes."""
+
+    def __init__(self):
+        self._data = {}  # key -> (expires, bytes)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key, value, ex=None):
+        expires = time.monotonic() + ex if ex is not None else float("inf")
+        with self._lock:
+            self._data[key] = (expires, value.encode() if isinstance(value, str) else value)
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            keys = list(self._data)
+        return (key for key in keys if fnmatch.fnmatchcase(key, match))
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+
+class ResultCache:
+    """Response cache for endpoints that are pure functions of their input and model.
+
+    Keys are a SHA-256 of the canonical JSON of the validated input plus the
+    model version, so a reloaded model never serves results from the old one.
+    """
+
+    def __init__(self, backend, ttl=RESULT_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(version, payload):
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{version}|{canonical}".encode()).hexdigest()
+
+    async def _call(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def _count(self, namespace, field):
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "errors": 0, "invalidations": 0})
+            stats[field] += 1
+
+    async def get_or_compute(self, namespace, version, payload, compute):
+        """Return the cached result for payload or await compute() and store it.
+
+        A None version (model not loaded yet) bypasses the cache.
+        """
+        if self.backend is None or version is None:
+            return await compute()
+        key = self.make_key(version, payload)
+        try:
+            cached = await self._call(self.backend.get, namespace, key)
+        except Exception:
+            self._count(namespace, "errors")
+            cached = None
+        if cached is not None:
+            self._count(namespace, "hits")
+            return cached
+        self._count(namespace, "misses")
+        result = await compute()
+        if "error" not in result:
+            try:
+                await self._call(self.backend.set, namespace, key, result, self.ttl)
+            except Exception:
+                self._count(namespace, "errors")
+        return result
+
+    def invalidate(self, namespace):
+        # Called from the model reload thread, so a blocking backend is fine here
+        if self.backend is not None:
+            self.backend.invalidate(namespace)
+        self._count(namespace, "invalidations")
+
+    def metrics(self):
+        with self._lock:
+            namespaces = {
+                namespace: {
+                    **stats,
+                    "hit_rate": round(stats["hits"] / (stats["hits"] + stats["misses"]), 4)
+                    if stats["hits"] + stats["misses"] else 0.0,
+                }
+                for namespace, stats in self._stats.items()
+            }
+        return {
+            "backend": self.backend.name if self.backend is not None else None,
+            "ttl_seconds": self.ttl,
+            "entries": self.backend.size() if self.backend is not None else 0,
+            "namespaces": namespaces,
+        }
+
+
+def create_result_cache(backend=RESULT_CACHE_BACKEND):
+    if backend == "none":
+        return ResultCache(None)
+    if backend == "redis":
+        import redis  # Optional dependency, only needed for the shared backend
+        return ResultCache(RedisBackend(redis.Redis.from_url(RESULT_CACHE_URL)))
+    return ResultCache(MemoryBackend())
+
+
+if __name__ == "__main__":
+    # Self-check of the shared (Redis) path against the in-process stand-in
+    async def check():
+        cache = ResultCache(RedisBackend(InProcessRedis()))
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return {"value": len(calls)}
+
+        first = await cache.get_or_compute("crop_yield", "v1", {"x": 1}, compute)
+        second = await cache.get_or_compute("crop_yield", "v1", {"x": 1}, compute)
+        other = await cache.get_or_compute("soil_crop", "v1", {"x": 1}, compute)
+        assert first == second == {"value": 1} and other == {"value": 2}, (first, second, other)
+        cache.invalidate("crop_yield")
+        after = await cache.get_or_compute("crop_yield", "v1", {"x": 1}, compute)
+        kept = await cache.get_or_compute("soil_crop", "v1", {"x": 1}, compute)
+        assert after == {"value": 3} and kept == {"value": 2}, (after, kept)
+        stats = cache.metrics()["namespaces"]
+        assert stats["crop_yield"] == {"hits": 1, "misses": 2, "errors": 0, "invalidations": 1, "hit_rate": 0.3333}
+        assert stats["soil_crop"]["hits"] == 1 and stats["soil_crop"]["misses"] == 1
+        print("OK", stats)
+
+    asyncio.run(check())
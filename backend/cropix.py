@@ -0,0 +1,315 @@
+"""Offline batch scoring for the CROPIX models, without the HTTP server.
+
+Records are streamed from CSV or JSONL files (or image files/directories for
+disease), split into chunks and scored on a pool of worker processes. Each
+worker loads its model once. Results are written in input order as chunks
+finish, as JSONL (ending with the same done line as the API's NDJSON
+streams) or CSV, so a long run can be watched and a cut file recognised.
+
+    python cropix.py yield districts.csv -o yields.jsonl
+    python cropix.py soil samples.jsonl -o soil.csv --top-k 3 --workers 8
+    python cropix.py fertilizer fields.csv -o fertilizer.jsonl
+    python cropix.py disease survey_photos/ -o disease.jsonl --top-k 3
+    python cropix.py market series.csv -o prices.jsonl
+
+Every record gets one result with the same fields as the matching /batch/
+endpoint, tagged with its 0-based "index" (and "filename" for images).
+Invalid records get an "error" instead of stopping the run. --workers
+defaults to one process per core, and the cores' BLAS/TensorFlow threads
+are split between the processes.
+"""
+import serving
+serving.configure_threads()  # Before numpy/xgboost start their thread pools
+
+import argparse
+import collections
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pydantic import ValidationError
+
+from batch import BATCH_CHUNK_SIZE, csv_rows, done_line, format_validation_error, iter_batch, ndjson
+from imaging import decode_image
+from jobs import IMAGE_EXTENSIONS
+from lite import lite_model_path
+from market import MarketForecastService
+from ranking import MAX_TOP_K, check_top_k
+from schemas import (CropYieldInput, FertilizerRecommendationInput, MarketSeriesRequest, SoilCropRecommendationInput,
+                     crop_yield_results, disease_result, fertilizer_results, soil_crop_results)
+from soil_index import open_index
+from tabular import TabularModel
+
+CROP_YIELD_MODEL_PATH = 'Trained_models/CROP_YIELD_MODEL.joblib'
+SOIL_CROP_MODEL_PATH = 'Trained_models/Soil_crop_recom.joblib'
+FERTILIZER_MODEL_PATH = 'Trained_models/fertilizer_recommendation_model.joblib'
+DISEASE_MODEL_PATH = 'Trained_models/CNN/Disease_Detection_model[CNN].h5'
+DISEASE_CLASSES_PATH = 'Trained_models/CNN/disease_classes.npy'
+MARKET_MODEL_PATH = 'Trained_models/lstm_model.keras'
+MARKET_DATA_PATH = 'Datasets/central_india_weekly_crop_prices.csv'
+MARKET_STORE_ROOT = 'Datasets/price_store'
+DISEASE_CHUNK_SIZE = 32
+PROGRESS_INTERVAL = 10.0  # Seconds between progress lines on stderr
+
+if serving.MODEL_RUNTIME == "tflite":
+    DISEASE_MODEL_PATH = lite_model_path("disease_cnn")
+    MARKET_MODEL_PATH = lite_model_path("market_lstm")
+
+# Result fields per command, for CSV output (nested values are written as JSON)
+COLUMNS = {
+    "yield": ["predicted_yield"],
+    "soil": ["recommended_crop", "top_k"],
+    "fertilizer": ["recommended_N", "recommended_P", "recommended_K"],
+    "disease": ["filename", "predicted_disease", "confidence", "top_k"],
+    "market": ["region", "crop", "forecast"],
+}
+
+
+# --- Reading inputs ---
+
+def read_records(paths):
+    """Yield record dicts from CSV and JSONL files ("-" reads JSONL from stdin)."""
+    for path in paths:
+        if path == "-":
+            yield from _jsonl_records(sys.stdin)
+        elif path.lower().endswith(".csv"):
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                yield from csv_rows(f)
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield from _jsonl_records(f)
+
+
+def _jsonl_records(lines):
+    for line in lines:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line  # Reported as an invalid row, like a non-object JSON value
+
+
+def image_paths(paths):
+    """Yield image files from the given files and (recursively, in sorted order) directories."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith("."):
+                    yield os.path.join(root, name)
+
+
+def chunked(items, size):
+    """Yield (start index, list) chunks of an iterable without materializing it."""
+    chunk, start = [], 0
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield start, chunk
+            start += size
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+# --- Worker processes ---
+
+_worker = {}  # This process's loaded model and options, set by load_worker()
+
+
+def load_worker(command, top_k):
+    """Load the command's model once per process. A failure is raised again by the first chunk."""
+    _worker["top_k"] = top_k
+    try:
+        _load_model(command, top_k)
+    except Exception as e:
+        _worker["error"] = e
+
+
+def _load_model(command, top_k):
+    if command == "yield":
+        model = TabularModel(serving.load_joblib(CROP_YIELD_MODEL_PATH))
+        _worker["predict"] = lambda records: crop_yield_results(model, records)
+    elif command == "soil":
+        knn = serving.load_joblib(SOIL_CROP_MODEL_PATH)
+        model = TabularModel(knn, index=open_index(SOIL_CROP_MODEL_PATH, knn))
+        _worker["predict"] = lambda records: soil_crop_results(model, records, top_k)
+    elif command == "fertilizer":
+        model = TabularModel(serving.load_joblib(FERTILIZER_MODEL_PATH))
+        _worker["predict"] = lambda records: fertilizer_results(model, records)
+    elif command == "disease":
+        _worker["model"] = serving.load_keras_model(DISEASE_MODEL_PATH)
+        _worker["classes"] = np.load(DISEASE_CLASSES_PATH, allow_pickle=True)
+
+
+def score_records(command, start, rows):
+    """Validate and score one chunk of records; indices are offset by start."""
+    if "error" in _worker:
+        raise _worker["error"]
+    schema = {"yield": CropYieldInput, "soil": SoilCropRecommendationInput,
+              "fertilizer": FertilizerRecommendationInput}[command]
+    results = next(iter_batch(rows, schema, _worker["predict"], chunk_size=len(rows)))
+    for result in results:
+        result["index"] += start
+    return results
+
+
+def score_images(command, start, paths):
+    """Decode and classify one chunk of image files in a single CNN batch."""
+    if "error" in _worker:
+        raise _worker["error"]
+    results, images, decoded = [], [], []
+    for index, path in enumerate(paths, start):
+        try:
+            with open(path, "rb") as f:
+                images.append(decode_image(f.read()))
+            decoded.append((index, path))
+        except Exception as e:
+            results.append({"index": index, "filename": path, "error": f"Could not decode image: {e}"})
+    if decoded:
+        try:
+            probabilities = np.asarray(_worker["model"].predict_on_batch(np.stack(images)))
+            results.extend({"index": index, "filename": path,
+                            **disease_result(row, _worker["classes"], _worker["top_k"])}
+                           for (index, path), row in zip(decoded, probabilities))
+        except Exception as e:
+            results.extend({"index": index, "filename": path, "error": str(e)} for index, path in decoded)
+    return sorted(results, key=lambda result: result["index"])
+
+
+def run_chunks(command, chunks, score, workers, top_k):
+    """Yield each chunk's results in input order, scoring up to 2 * workers chunks ahead."""
+    if workers == 1:
+        load_worker(command, top_k)
+        for start, chunk in chunks:
+            yield score(command, start, chunk)
+        return
+    serving.configure_worker_processes(workers)
+    # spawn: TensorFlow is not fork-safe, and fresh processes pick up the per-worker thread caps
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=load_worker, initargs=(command, top_k)) as pool:
+        pending = collections.deque()
+        for start, chunk in chunks:
+            pending.append(pool.submit(score, command, start, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def forecast_series(records):
+    """Market series need one batched LSTM rollout over all regions, so they run in this process."""
+    serving.configure_tensorflow()
+    service = MarketForecastService(MARKET_MODEL_PATH, MARKET_STORE_ROOT, sources={"central_india": MARKET_DATA_PATH})
+    snapshot = service.load()
+    requests, errors = [], {}
+    for index, row in enumerate(records):
+        try:
+            requests.append((index, MarketSeriesRequest(**row)))
+        except (ValidationError, TypeError) as e:
+            errors[index] = format_validation_error(e) if isinstance(e, ValidationError) else "Row must be a JSON object"
+    results = [{"index": index, "error": message} for index, message in errors.items()]
+    for result in snapshot.series_results([request for _, request in requests]):
+        result["index"] = requests[result["index"]][0]
+        results.append(result)
+    yield sorted(results, key=lambda result: result["index"])
+
+
+# --- Writing results ---
+
+class ResultWriter:
+    """Writes results as JSONL (with a closing done line) or CSV, flushing after every chunk."""
+
+    def __init__(self, path, columns):
+        self.file = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+        self.csv = None
+        if path.lower().endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, ["index", *columns, "error"], extrasaction="ignore")
+            self.csv.writeheader()
+        self.count = 0
+        self.error_count = 0
+
+    def write(self, results):
+        for result in results:
+            if self.csv is None:
+                self.file.write(ndjson(result))
+            else:
+                self.csv.writerow({key: json.dumps(value) if isinstance(value, (list, dict)) else value
+                                   for key, value in result.items()})
+        self.count += len(results)
+        self.error_count += sum(1 for result in results if "error" in result)
+        self.file.flush()
+
+    def close(self):
+        if self.csv is None:
+            self.file.write(done_line(self.count, self.error_count))
+        if self.file is not sys.stdout:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score CSV/JSONL records or image folders with the CROPIX models.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    helps = {
+        "yield": "Crop yield (CropYieldInput fields)",
+        "soil": "Soil-based crop recommendation (N, P, K, temperature, humidity, ph, rainfall)",
+        "fertilizer": "Fertilizer recommendation (Crop, Current_N, Current_P, Current_K)",
+        "disease": "Disease detection for image files and directories",
+        "market": "Market price series (crop, weeks, region)",
+    }
+    for name, help_text in helps.items():
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("inputs", nargs="+", help="CSV/JSONL files ('-' = JSONL on stdin)"
+                             if name != "disease" else "Image files or directories")
+        command.add_argument("-o", "--output", default="-", help="Output .jsonl or .csv file (default: stdout)")
+        if name != "market":
+            command.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+            command.add_argument("--chunk-size", type=int,
+                                 default=DISEASE_CHUNK_SIZE if name == "disease" else BATCH_CHUNK_SIZE)
+        if name in ("soil", "disease"):
+            command.add_argument("--top-k", type=int, help=f"Also list the best 1-{MAX_TOP_K} classes")
+    args = parser.parse_args()
+
+    top_k = getattr(args, "top_k", None)
+    invalid = check_top_k(top_k)
+    if invalid:
+        parser.error(invalid["error"])
+    if args.command == "market":
+        results = forecast_series(list(read_records(args.inputs)))
+    elif args.command == "disease":
+        chunks = chunked(image_paths(args.inputs), args.chunk_size)
+        results = run_chunks(args.command, chunks, score_images, max(1, args.workers), top_k)
+    else:
+        chunks = chunked(read_records(args.inputs), args.chunk_size)
+        results = run_chunks(args.command, chunks, score_records, max(1, args.workers), top_k)
+
+    writer = ResultWriter(args.output, COLUMNS[args.command])
+    started = last_report = time.monotonic()
+    try:
+        for chunk_results in results:
+            writer.write(chunk_results)
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                print(f"{writer.count} scored ({writer.count / (last_report - started):.0f}/s), "
+                      f"{writer.error_count} errors", file=sys.stderr)
+    except Exception as e:
+        # e.g. the model could not be loaded; the output stays without a done line
+        writer.file.flush()
+        sys.exit(f"cropix {args.command}: {e}")
+    writer.close()
+    elapsed = time.monotonic() - started
+    print(f"{writer.count} scored in {elapsed:.1f}s, {writer.error_count} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Content-addressed cache of disease CNN outputs for repeated uploads.
+
+Field apps retry uploads, so the same photo often arrives several times.
+Entries are keyed by the model version plus a SHA-256 of the image bytes
+(after base64 decoding), so an exact repeat skips decoding and the CNN. A
+repeat that arrives while the first copy is still being processed waits for
+that result instead of running its own (in-flight coalescing).
+
+With DISEASE_DEDUP_MODE=perceptual, images whose bytes differ (re-encoded,
+re-compressed or resized copies) are also matched. A 64-bit difference hash
+of the decoded image is compared with the cached ones, allowing up to
+DISEASE_DEDUP_MAX_DISTANCE differing bits. Those copies still pay for
+decoding but skip the CNN.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+DISEASE_DEDUP_MODE = os.getenv("DISEASE_DEDUP_MODE", "exact").lower()  # off | exact | perceptual
+DISEASE_DEDUP_MAX_ENTRIES = int(os.getenv("DISEASE_DEDUP_MAX_ENTRIES", "4096"))
+DISEASE_DEDUP_MAX_DISTANCE = int(os.getenv("DISEASE_DEDUP_MAX_DISTANCE", "4"))
+HASH_SIZE = 8  # 8x8 gradient bits = 64-bit hash
+
+
+def difference_hash(image):
+    """64-bit dHash of a decoded (H, W, 3) image in [0, 1]: is each pixel brighter than its right neighbour?"""
+    # Area-average in float: quantizing first creates ties that JPEG noise flips
+    gray = Image.fromarray(np.asarray(image, dtype=np.float32).mean(axis=2), mode="F")
+    small = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX))
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class DedupCache:
+    """Bounded LRU of model outputs keyed by image content, with in-flight coalescing."""
+
+    def __init__(self, mode=DISEASE_DEDUP_MODE, max_entries=DISEASE_DEDUP_MAX_ENTRIES,
+                 max_distance=DISEASE_DEDUP_MAX_DISTANCE):
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # content key -> (version, perceptual hash, output)
+        self._perceptual = OrderedDict()  # (version, perceptual hash) -> output
+        self._pending = {}
+        self._stats = {"hits": 0, "perceptual_hits": 0, "coalesced": 0, "misses": 0, "bytes_saved": 0}
+        self._lock = threading.Lock()
+
+    async def get_or_compute(self, version, image_data, decode, infer):
+        """Return infer(await decode(image_data)) for these bytes, reusing earlier or in-flight results.
+
+        decode and infer are coroutine functions. A None version (model not loaded yet) bypasses the cache.
+        """
+        if self.mode == "off" or version is None:
+            return await infer(await decode(image_data))
+        key = hashlib.sha256(version.encode() + b"|" + image_data).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            pending = self._pending.get(key)
+            if entry is None and pending is None:
+                self._pending[key] = future = asyncio.get_running_loop().create_future()
+        if entry is not None:
+            self._count("hits", len(image_data))
+            return entry[2]
+        if pending is not None:
+            self._count("coalesced", len(image_data))
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # This request was cancelled, not the one computing the result
+            # The request computing it was cancelled; compute it for this one instead
+            return await self.get_or_compute(version, image_data, decode, infer)
+
+        try:
+            image = await decode(image_data)
+            fingerprint = difference_hash(image) if self.mode == "perceptual" else None
+            output = self._find_similar(version, fingerprint) if fingerprint is not None else None
+            if output is None:
+                self._count("misses")
+                output = await infer(image)
+            else:
+                self._count("perceptual_hits")
+            self._store(key, version, fingerprint, output)
+            future.set_result(output)
+            return output
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved: there may be no coalesced waiters
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _find_similar(self, version, fingerprint):
+        with self._lock:
+            output = self._perceptual.get((version, fingerprint))
+            if output is not None or self.max_distance <= 0 or not self._perceptual:
+                return output
+            keys = list(self._perceptual)
+        hashes = np.array([hash_ for entry_version, hash_ in keys if entry_version == version], dtype=np.uint64)
+        if not len(hashes):
+            return None
+        distances = np.bitwise_count(hashes ^ np.uint64(fingerprint))
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None
+        with self._lock:
+            return self._perceptual.get((version, int(hashes[best])))
+
+    def _store(self, key, version, fingerprint, output):
+        with self._lock:
+            self._entries[key] = (version, fingerprint, output)
+            if fingerprint is not None:
+                self._perceptual[(version, fingerprint)] = output
+                self._perceptual.move_to_end((version, fingerprint))
+            while len(self._entries) > self.max_entries:
+                _, (old_version, old_fingerprint, _) = self._entries.popitem(last=False)
+                self._perceptual.pop((old_version, old_fingerprint), None)
+            while len(self._perceptual) > self.max_entries:
+                self._perceptual.popitem(last=False)
+
+    def _count(self, event, image_bytes=0):
+        with self._lock:
+            self._stats[event] += 1
+            # Exact and coalesced repeats skip decoding as well as the CNN
+            if event in ("hits", "coalesced"):
+                self._stats["bytes_saved"] += image_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._perceptual.clear()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+        lookups = stats["hits"] + stats["perceptual_hits"] + stats["coalesced"] + stats["misses"]
+        return {
+            "mode": self.mode,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            **stats,
+            "hit_rate": round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0,
+        }
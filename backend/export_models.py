@@ -0,0 +1,183 @@
+"""Export the disease CNN and market LSTM to TFLite and compare the variants.
+
+For each model this writes float32, float16 and int8 exports to
+Trained_models/optimized/ (see lite.py). The CNN's int8 export is fully
+integer-quantized, calibrated on the leaf images in --calibration-dir. The
+LSTM's recurrent ops keep float activations, so it uses dynamic-range int8
+weights. The report runs Keras and every export on the same inputs and
+records size, latency and accuracy drift as JSON.
+
+    python export_models.py
+    python export_models.py --models market_lstm --variants float16 --report-only
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import serving
+from imaging import decode_image
+from lite import OPTIMIZED_MODEL_DIR, VARIANTS, LiteModel, lite_model_path
+from market import N_STEPS
+
+DISEASE_MODEL_PATH = 'Trained_models/CNN/Disease_Detection_model[CNN].h5'
+MARKET_MODEL_PATH = 'Trained_models/lstm_model.keras'
+MARKET_DATA_PATH = 'Datasets/central_india_weekly_crop_prices.csv'
+DEFAULT_CALIBRATION_DIR = 'Datasets/leaf_samples'
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# --- Sample inputs ---
+
+def leaf_images(calibration_dir, limit):
+    """Decoded (N, 256, 256, 3) leaf images; falls back to Leaf_img.jpg with flips/crops."""
+    paths = sorted(
+        path for path in glob.glob(os.path.join(calibration_dir, "**", "*"), recursive=True)
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    if paths:
+        images = []
+        for path in paths:
+            with open(path, "rb") as f:
+                images.append(decode_image(f.read()))
+        return np.stack(images)
+    with open("Leaf_img.jpg", "rb") as f:
+        base = decode_image(f.read())
+    # Cheap augmentations so calibration sees more than one activation range
+    variants = [base, base[:, ::-1], base[::-1], np.rot90(base), np.clip(base * 0.8, 0, 1), np.clip(base * 1.2, 0, 1)]
+    return np.stack(variants).astype(np.float32)
+
+
+def market_windows(limit):
+    """Every N_STEPS-week window of the scaled price history, as (N, N_STEPS, n_features)."""
+    import pandas as pd
+    from sklearn.preprocessing import MinMaxScaler
+
+    df = pd.read_csv(MARKET_DATA_PATH, index_col='Date', parse_dates=True)
+    scaled = MinMaxScaler(feature_range=(0, 1)).fit_transform(df).astype(np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(scaled, (N_STEPS, scaled.shape[1]))[:, 0]
+    return np.ascontiguousarray(windows[-limit:])
+
+
+# --- Conversion ---
+
+def convert(model, input_shape, variant, calibration, full_integer):
+    import tensorflow as tf  # type: ignore
+
+    # Going through a SavedModel freezes the Keras 3 variables; a direct concrete
+    # function conversion leaves READ_VARIABLE ops the LSTM cannot run
+    export_dir = tempfile.mkdtemp()
+    try:
+        model.export(export_dir, input_signature=[tf.TensorSpec(input_shape, tf.float32)], verbose=False)
+        converter = tf.lite.TFLiteConverter.from_saved_model(export_dir)
+        if variant != "float32":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if variant == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        if variant == "int8" and full_integer:
+            converter.representative_dataset = lambda: ([sample[np.newaxis]] for sample in calibration)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        return converter.convert()
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+
+
+def export(name, model, input_shape, variants, calibration, full_integer):
+    os.makedirs(OPTIMIZED_MODEL_DIR, exist_ok=True)
+    for variant in variants:
+        path = lite_model_path(name, variant)
+        with open(path, "wb") as f:
+            f.write(convert(model, input_shape, variant, calibration, full_integer and variant == "int8"))
+        print(f"wrote {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
+
+
+# --- Report ---
+
+def time_calls(predict, inputs, repeats):
+    predict(inputs[:1])  # Warm-up (graph tracing, tensor allocation)
+    timings = []
+    for _ in range(repeats):
+        for sample in inputs:
+            start = time.perf_counter()
+            predict(sample[np.newaxis])
+            timings.append(time.perf_counter() - start)
+    timings_ms = np.array(timings) * 1000
+    return {"p50_ms": round(float(np.percentile(timings_ms, 50)), 3),
+            "p99_ms": round(float(np.percentile(timings_ms, 99)), 3)}
+
+
+def compare(name, keras_model, path_of, inputs, variants, repeats, classification):
+    reference = np.concatenate([np.asarray(keras_model.predict_on_batch(sample[np.newaxis])) for sample in inputs])
+    rows = {"keras": {"size_kib": round(os.path.getsize(path_of(None)) / 1024, 1),
+                      **time_calls(keras_model.predict_on_batch, inputs, repeats)}}
+    for variant in variants:
+        path = path_of(variant)
+        if not os.path.exists(path):
+            continue
+        lite = LiteModel(path)
+        outputs = np.concatenate([lite.predict_on_batch(sample[np.newaxis]) for sample in inputs])
+        row = {"size_kib": round(os.path.getsize(path) / 1024, 1), **time_calls(lite.predict_on_batch, inputs, repeats),
+               "max_abs_diff": float(np.abs(outputs - reference).max()),
+               "mean_abs_diff": float(np.abs(outputs - reference).mean())}
+        if classification:
+            row["top1_agreement"] = float((outputs.argmax(axis=1) == reference.argmax(axis=1)).mean())
+        rows[f"tflite-{variant}"] = row
+    print(f"\n{name} ({len(inputs)} inputs)")
+    for label, row in rows.items():
+        drift = f"  max|diff| {row['max_abs_diff']:.2e}" if "max_abs_diff" in row else ""
+        agree = f"  top-1 {row['top1_agreement']:.1%}" if "top1_agreement" in row else ""
+        print(f"  {label:16s} {row['size_kib']:9.1f} KiB  p50 {row['p50_ms']:8.3f} ms{drift}{agree}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the TensorFlow models to TFLite and report accuracy vs latency.")
+    parser.add_argument("--models", nargs="*", default=["disease_cnn", "market_lstm"])
+    parser.add_argument("--variants", nargs="*", default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument("--calibration-dir", default=DEFAULT_CALIBRATION_DIR,
+                        help="Leaf images used to calibrate the int8 CNN (default: augmented Leaf_img.jpg)")
+    parser.add_argument("--samples", type=int, default=64, help="Max calibration/report inputs per model")
+    parser.add_argument("--repeats", type=int, default=5, help="Timing passes over the report inputs")
+    parser.add_argument("--report-only", action="store_true", help="Skip export, only compare existing files")
+    parser.add_argument("--report", default=os.path.join(OPTIMIZED_MODEL_DIR, "report.json"))
+    args = parser.parse_args()
+
+    serving.configure_tensorflow()
+    from tensorflow.keras.models import load_model  # type: ignore
+
+    jobs = {
+        "disease_cnn": (DISEASE_MODEL_PATH, lambda: leaf_images(args.calibration_dir, args.samples), True),
+        "market_lstm": (MARKET_MODEL_PATH, lambda: market_windows(args.samples), False),
+    }
+    report = {"threads": serving.THREADS_PER_WORKER, "models": {}}
+    for name in args.models:
+        keras_path, sample_inputs, is_cnn = jobs[name]
+        try:
+            model = load_model(keras_path)
+        except Exception as e:
+            # e.g. the .h5 is still a Git LFS pointer
+            print(f"skipping {name}: cannot load {keras_path}: {e}")
+            report["models"][name] = {"error": str(e)}
+            continue
+        inputs = sample_inputs()
+        # The CNN export keeps a dynamic batch for micro-batching; the LSTM rollout always uses batch 1
+        input_shape = (None, *inputs.shape[1:]) if is_cnn else (1, *inputs.shape[1:])
+        if not args.report_only:
+            export(name, model, input_shape, args.variants, inputs, full_integer=is_cnn)
+        report["models"][name] = compare(
+            name, model, lambda variant: keras_path if variant is None else lite_model_path(name, variant),
+            inputs, args.variants, args.repeats, classification=is_cnn)
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# Multi-worker serving: gunicorn -c gunicorn.conf.py main:app
+#
+# The scikit-learn/XGBoost artifacts are loaded once in the master
+# (preload_app) and shared copy-on-write with every forked worker.
+# TensorFlow is not fork-safe, so the CNN and LSTM load inside each worker.
+import os
+
+os.environ.setdefault("CROPIX_PRELOAD", "1")
+
+from serving import WORKERS  # noqa: E402
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7860')}"
+workers = WORKERS
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+graceful_timeout = 30
@@ -0,0 +1,24 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+TARGET_SIZE = (256, 256)  # Input size of the disease CNN
+
+
+def decode_image(image_bytes, target_size=TARGET_SIZE):
+    """Decode image bytes straight into a float32 (H, W, 3) array scaled to [0, 1].
+
+    Same steps as the old load_img path (RGB, nearest-neighbour resize, /255)
+    without writing anything to disk, with one difference: JPEGs are decoded
+    with draft(), so libjpeg downscales large camera photos by 1/2, 1/4 or 1/8
+    in the DCT before the resize. For JPEGs at least twice the target size the
+    pixel values therefore differ slightly from the old path.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("RGB", target_size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size != target_size:
+        image = image.resize(target_size, Image.NEAREST)
+    return np.divide(np.asarray(image, dtype=np.uint8), np.float32(255.0), dtype=np.float32)
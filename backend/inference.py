@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import MODEL_INFERENCE_SECONDS, span
+
+
+class Overloaded(Exception):
+    """Raised when a model's queue is full; the API turns it into a 503."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is overloaded, retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """A sized thread pool for one model with a bounded number of pending calls.
+
+    The native predict loops of XGBoost, scikit-learn and TensorFlow release
+    the GIL, so threads give real parallelism without copying models into
+    child processes. Counters are only touched from the event loop thread.
+    """
+
+    def __init__(self, name, workers, max_queue, stage="inference"):
+        self.name = name
+        self.stage = stage
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"infer-{name}")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.avg_seconds = 0.0  # Exponentially weighted call duration
+
+    def _call(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with span(self.stage):
+                return fn(*args, **kwargs)
+        finally:
+            MODEL_INFERENCE_SECONDS.observe(time.perf_counter() - start, model=self.name)
+
+    def retry_after(self):
+        backlog = self.pending / self.workers
+        return max(1, math.ceil(backlog * self.avg_seconds))
+
+    async def run(self, fn, *args, **kwargs):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.name, self.retry_after())
+        self.pending += 1
+        start = time.perf_counter()
+        # Carry the request context into the worker thread so spans know their endpoint
+        context = contextvars.copy_context()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, context.run, functools.partial(self._call, fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            elapsed = time.perf_counter() - start
+            self.avg_seconds = elapsed if self.completed == 1 else 0.9 * self.avg_seconds + 0.1 * elapsed
+
+    def status(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.avg_seconds * 1000, 3),
+        }
+
+
+class InferenceExecutor:
+    """Routes each model's blocking calls to its own InferencePool.
+
+    Pool sizes can be overridden per model with INFERENCE_<NAME>_WORKERS and
+    INFERENCE_<NAME>_QUEUE environment variables.
+    """
+
+    def __init__(self):
+        self.pools = {}
+
+    def add_pool(self, name, workers, max_queue, stage="inference"):
+        prefix = f"INFERENCE_{name.upper()}"
+        workers = int(os.getenv(f"{prefix}_WORKERS", workers))
+        max_queue = int(os.getenv(f"{prefix}_QUEUE", max_queue))
+        self.pools[name] = InferencePool(name, workers, max_queue, stage)
+
+    async def run(self, name, fn, *args, **kwargs):
+        return await self.pools[name].run(fn, *args, **kwargs)
+
+    def status(self):
+        return {name: pool.status() for name, pool in self.pools.items()}
@@ -0,0 +1,370 @@
+"""Disk-backed bulk disease screening jobs.
+
+Each job is a directory under DISEASE_JOBS_DIR:
+
+    job.json        status, counts and timestamps (replaced atomically)
+    images/         the submitted images, one file each
+    results.jsonl   one line per processed image, appended as batches finish
+    .lock           file lock held by the process running the job
+    .cancel         present once cancellation was requested
+
+Any API worker can submit or read a job. A job is run by whichever worker
+first locks it, and a job left queued or running by a dead process is
+resumed on the next startup, skipping the images already in results.jsonl.
+"""
+import asyncio
+import datetime
+import functools
+import json
+import os
+import re
+import shutil
+import tarfile
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from imaging import decode_image
+from locks import lock_file
+
+DISEASE_JOBS_DIR = os.getenv("DISEASE_JOBS_DIR", "jobs/disease")
+JOB_BATCH_SIZE = int(os.getenv("DISEASE_JOB_BATCH_SIZE", "32"))
+JOB_DECODE_THREADS = int(os.getenv("DISEASE_JOB_DECODE_THREADS", "4"))
+JOB_MAX_IMAGES = int(os.getenv("DISEASE_JOB_MAX_IMAGES", "100000"))
+# Total bytes written into a job's images/ (caps archives that expand far beyond their upload size)
+JOB_MAX_BYTES = int(os.getenv("DISEASE_JOB_MAX_BYTES", str(2 * 1024 ** 3)))
+COPY_CHUNK_BYTES = 1024 * 1024
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+FINISHED = ("done", "failed", "cancelled")
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _safe_name(index, name):
+    base = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(name.replace("\\", "/")))
+    return f"{index:06d}_{base}"
+
+
+def _original_name(name):
+    return name.split("_", 1)[1]
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith(".")
+
+
+class JobStore:
+    """Job directories on local disk; safe to use from several processes."""
+
+    def __init__(self, root=DISEASE_JOBS_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, job_id, *parts):
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.root, job_id, *parts)
+
+    def read(self, job_id):
+        try:
+            with open(self.path(job_id, "job.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(job_id)
+
+    def write(self, job):
+        tmp = self.path(job["id"], "job.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, self.path(job["id"], "job.json"))
+
+    def update(self, job_id, **fields):
+        job = {**self.read(job_id), **fields, "updated_at": _now()}
+        self.write(job)
+        return job
+
+    def create(self, add_images):
+        """Create a job; add_images(images_dir) writes the inputs and returns their count."""
+        job_id = uuid.uuid4().hex
+        images_dir = self.path(job_id, "images")
+        os.makedirs(images_dir)
+        try:
+            total = add_images(images_dir)
+        except Exception:
+            shutil.rmtree(self.path(job_id), ignore_errors=True)
+            raise
+        if total == 0:
+            shutil.rmtree(self.path(job_id), ignore_errors=True)
+            raise ValueError("No images found in the upload.")
+        job = {"id": job_id, "status": "queued", "total": total, "processed": 0, "errors": 0,
+               "created_at": _now(), "updated_at": _now(), "error": None}
+        self.write(job)
+        return job
+
+    def images(self, job_id):
+        return sorted(os.listdir(self.path(job_id, "images")))
+
+    def results(self, job_id):
+        """Results written so far, sorted by image index. A torn last line is ignored."""
+        results = []
+        try:
+            with open(self.path(job_id, "results.jsonl")) as f:
+                for line in f:
+                    try:
+                        results.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return sorted(results, key=lambda result: result["index"])
+
+    def repair_results(self, job_id):
+        """Cut a line torn by a crash mid-append, so new results start on a fresh line."""
+        try:
+            with open(self.path(job_id, "results.jsonl"), "r+b") as f:
+                data = f.read()
+                f.truncate(data.rfind(b"\n") + 1)
+        except FileNotFoundError:
+            pass
+
+    def append_results(self, job_id, results):
+        with open(self.path(job_id, "results.jsonl"), "a") as f:
+            f.write("".join(json.dumps(result) + "\n" for result in results))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def unfinished(self):
+        job_ids = []
+        for entry in os.scandir(self.root):
+            try:
+                if self.read(entry.name)["status"] not in FINISHED:
+                    job_ids.append(entry.name)
+            except KeyError:
+                continue
+        return job_ids
+
+    def try_lock(self, job_id):
+        """Return an open lock file if this process now owns the job, else None."""
+        handle = open(self.path(job_id, ".lock"), "w")
+        if not lock_file(handle, blocking=False):
+            handle.close()
+            return None
+        return handle
+
+    def request_cancel(self, job_id):
+        """Ask whichever process runs the job to stop after its current batch."""
+        job = self.read(job_id)
+        open(self.path(job_id, ".cancel"), "w").close()
+        if job["status"] == "queued":
+            job = self.update(job_id, status="cancelled")
+        return job
+
+    def cancel_requested(self, job_id):
+        return os.path.exists(self.path(job_id, ".cancel"))
+
+    def delete(self, job_id):
+        self.read(job_id)
+        shutil.rmtree(self.path(job_id))
+
+
+# --- Writing uploads into a job ---
+
+class _ImageWriter:
+    """Writes a job's images into images_dir, enforcing JOB_MAX_IMAGES and JOB_MAX_BYTES."""
+
+    def __init__(self, images_dir, max_images=JOB_MAX_IMAGES, max_bytes=JOB_MAX_BYTES):
+        self.images_dir = images_dir
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.count = 0
+        self.bytes = 0
+
+    def add(self, name, source):
+        if self.count >= self.max_images:
+            raise ValueError(f"Too many images (max {self.max_images}).")
+        # Names are rebuilt from the basename, so entries like ../../x cannot escape images_dir
+        with open(os.path.join(self.images_dir, _safe_name(self.count, name)), "wb") as out:
+            # Count the bytes actually written: archive headers can understate entry sizes
+            while True:
+                chunk = source.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                self.bytes += len(chunk)
+                if self.bytes > self.max_bytes:
+                    raise ValueError(f"Upload too large: images exceed {self.max_bytes} bytes.")
+                out.write(chunk)
+        self.count += 1
+
+
+def save_uploads(files, images_dir):
+    """Copy uploaded image files (objects with .filename and a binary .file) into images_dir."""
+    writer = _ImageWriter(images_dir)
+    for file in files:
+        if _is_image(file.filename or ""):
+            writer.add(file.filename, file.file)
+    return writer.count
+
+
+def extract_archive(fileobj, filename, images_dir):
+    """Extract the images of a .zip or .tar(.gz/.bz2/.xz) archive into images_dir, flattening paths."""
+    writer = _ImageWriter(images_dir)
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    with archive.open(info) as source:
+                        writer.add(info.filename, source)
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and _is_image(member.name):
+                    writer.add(member.name, archive.extractfile(member))
+    return writer.count
+
+
+# --- Running jobs ---
+
+def _decode_file(path):
+    with open(path, "rb") as f:
+        return decode_image(f.read())
+
+
+class JobRunner:
+    """Runs queued jobs one at a time in this process, as a three-stage pipeline.
+
+    Images are decoded on a thread pool while the previous batch is in the
+    CNN, so decoding, batch assembly and inference overlap. predict_batch
+    maps a (N, H, W, 3) array to class probabilities and labels() returns
+    the class names.
+    """
+
+    def __init__(self, store, predict_batch, labels, batch_size=JOB_BATCH_SIZE, decode_threads=JOB_DECODE_THREADS):
+        self.store = store
+        self.predict_batch = predict_batch
+        self.labels = labels
+        self.batch_size = batch_size
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_threads, thread_name_prefix="job-decode")
+        self._infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-infer")
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """Start the runner on the current event loop and resume unfinished jobs."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+        for job_id in self.store.unfinished():
+            self._queue.put_nowait(job_id)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def submit(self, job_id):
+        self._queue.put_nowait(job_id)
+
+    async def _run(self):
+        # One bad job must never end this loop, or every later job would stay queued
+        while True:
+            job_id = await self._queue.get()
+            lock = None
+            try:
+                try:
+                    lock = await self._in_pool(self._claim, job_id)
+                except (KeyError, OSError):
+                    continue  # Deleted (or unreadable) before its turn came
+                if lock is None:
+                    continue  # Another worker process is running it, or it already finished
+                try:
+                    await self._run_job(job_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    try:
+                        await self._in_pool(self.store.update, job_id, status="failed", error=str(e))
+                    except (KeyError, OSError):
+                        pass  # Job directory removed or not writable
+            finally:
+                if lock is not None:
+                    lock.close()
+
+    def _claim(self, job_id):
+        """Return the job's lock file if this process should run it now, else None."""
+        lock = self.store.try_lock(job_id)
+        if lock is None:
+            return None
+        try:
+            finished = self.store.read(job_id)["status"] in FINISHED
+        except BaseException:
+            lock.close()
+            raise
+        if finished:
+            lock.close()
+            return None
+        return lock
+
+    async def _in_pool(self, fn, *args, **kwargs):
+        """Run a blocking store call on the inference thread, off the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._infer_pool, functools.partial(fn, *args, **kwargs))
+
+    async def _run_job(self, job_id):
+        loop = asyncio.get_running_loop()
+        names = await self._in_pool(self.store.images, job_id)
+        await self._in_pool(self.store.repair_results, job_id)
+        previous = await self._in_pool(self.store.results, job_id)
+        done = {result["index"] for result in previous}
+        todo = [(index, name) for index, name in enumerate(names) if index not in done]
+        errors = sum(1 for result in previous if "error" in result)
+        await self._in_pool(self.store.update, job_id, status="running", processed=len(done), errors=errors)
+        labels = await loop.run_in_executor(self._infer_pool, self.labels)
+        images_dir = self.store.path(job_id, "images")
+
+        async def decode_batch(batch):
+            futures = [loop.run_in_executor(self._decode_pool, _decode_file, os.path.join(images_dir, name))
+                       for _, name in batch]
+            return await asyncio.gather(*futures, return_exceptions=True)
+
+        # Stage 1 (decode) for batch k+1 runs while stage 2 (inference) handles batch k
+        batches = [todo[start:start + self.batch_size] for start in range(0, len(todo), self.batch_size)]
+        next_decode = asyncio.ensure_future(decode_batch(batches[0])) if batches else None
+        processed = len(done)
+        for position, batch in enumerate(batches):
+            decoded = await next_decode
+            next_decode = (asyncio.ensure_future(decode_batch(batches[position + 1]))
+                           if position + 1 < len(batches) else None)
+            if await self._in_pool(self.store.cancel_requested, job_id):
+                if next_decode is not None:
+                    next_decode.cancel()
+                await self._in_pool(self.store.update, job_id, status="cancelled")
+                return
+
+            results = []
+            ok = [(item, array) for item, array in zip(batch, decoded) if not isinstance(array, Exception)]
+            for (index, name), array in zip(batch, decoded):
+                if isinstance(array, Exception):
+                    results.append({"index": index, "filename": _original_name(name), "error": f"Could not decode image: {array}"})
+            if ok:
+                try:
+                    probabilities = await loop.run_in_executor(
+                        self._infer_pool, self.predict_batch, np.stack([array for _, array in ok]))
+                    for ((index, name), _), row in zip(ok, probabilities):
+                        best = int(np.argmax(row))
+                        results.append({"index": index, "filename": _original_name(name),
+                                        "predicted_disease": str(labels[best]), "confidence": float(row[best])})
+                except Exception as e:
+                    results.extend({"index": index, "filename": _original_name(name), "error": str(e)} for (index, name), _ in ok)
+
+            await self._in_pool(self.store.append_results, job_id, results)
+            processed += len(results)
+            errors += sum(1 for result in results if "error" in result)
+            await self._in_pool(self.store.update, job_id, processed=processed, errors=errors)
+
+        await self._in_pool(self.store.update, job_id, status="done", processed=processed, errors=errors)
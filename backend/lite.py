@@ -0,0 +1,87 @@
+"""TFLite runtime for the exported disease CNN and market LSTM.
+
+export_models.py writes Trained_models/optimized/<name>.<variant>.tflite;
+set CROPIX_MODEL_RUNTIME=tflite (and CROPIX_TFLITE_VARIANT) to serve them
+instead of the Keras files.
+"""
+import os
+import threading
+
+import numpy as np
+
+import serving
+
+OPTIMIZED_MODEL_DIR = os.getenv("CROPIX_OPTIMIZED_MODEL_DIR", "Trained_models/optimized")
+VARIANTS = ("float32", "float16", "int8")
+
+
+def lite_model_path(name, variant=None):
+    return os.path.join(OPTIMIZED_MODEL_DIR, f"{name}.{variant or serving.TFLITE_VARIANT}.tflite")
+
+
+def _make_interpreter(path, num_threads):
+    try:
+        from ai_edge_litert.interpreter import Interpreter  # type: ignore  # Standalone runtime, no TF needed
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter  # type: ignore
+    return Interpreter(model_path=path, num_threads=num_threads)
+
+
+class LiteModel:
+    """A TFLite interpreter with the predict_on_batch interface of a Keras model.
+
+    The input tensor is resized when the batch size changes, and int8 inputs
+    and outputs are (de)quantized so callers always see float32. Interpreters
+    are not thread-safe, so invocations are serialized.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self.interpreter = _make_interpreter(path, num_threads or serving.THREADS_PER_WORKER)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        self._resizable = self._input["shape_signature"][0] == -1
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        return tuple(int(d) for d in self._input["shape_signature"])
+
+    @staticmethod
+    def _quantize(x, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] == np.float32 or not scale:
+            return x.astype(details["dtype"], copy=False)
+        info = np.iinfo(details["dtype"])
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(details["dtype"])
+
+    @staticmethod
+    def _dequantize(y, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] == np.float32 or not scale:
+            return y.astype(np.float32, copy=False)
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        if x.shape[0] != self._batch_size and not self._resizable:
+            # Fixed-batch export (e.g. the market LSTM): run the rows one by one
+            return np.concatenate([self._invoke(x[i:i + 1]) for i in range(x.shape[0])])
+        return self._invoke(x)
+
+    def _invoke(self, x):
+        with self._lock:
+            if x.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input["index"], x.shape)
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = x.shape[0]
+            self.interpreter.set_tensor(self._input["index"], self._quantize(x, self._input))
+            self.interpreter.invoke()
+            # get_tensor returns a copy, so the result outlives the next invoke
+            return self._dequantize(self.interpreter.get_tensor(self._output["index"]), self._output)
+
+    __call__ = predict_on_batch
@@ -0,0 +1,36 @@
+"""Cross-process advisory locks on an open file: flock on POSIX, msvcrt.locking on Windows.
+
+Either way the lock is released when the file is closed (or its process dies).
+"""
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def lock_file(handle, blocking=True):
+    """Take an exclusive lock on an open file.
+
+    Returns True once locked; with blocking=False, returns False instead of
+    waiting when another process holds it.
+    """
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            if blocking:
+                raise
+            return False
+        return True
+
+    # msvcrt locks a byte range from the current position; always use the first byte
+    handle.seek(0)
+    while True:
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            # LK_LOCK gives up after about 10 seconds; keep waiting like flock does
@@ -1,24 +1,41 @@
-from fastapi import FastAPI
+import serving
+serving.configure_threads()  # Before numpy/xgboost start their thread pools
+
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import joblib
+import functools
+import math
+import gc
 import numpy as np
-import pandas as pd
 import os
-import tensorflow as tf  # type: ignore
-from tensorflow.keras.models import load_model  # type: ignore
-from tensorflow.keras.preprocessing.image import ImageDataGenerator  # type: ignore
-from sklearn.preprocessing import LabelEncoder
 from dotenv import load_dotenv
-import requests
-import json
-from sklearn.preprocessing import MinMaxScaler
-from PIL import Image
 import io
+import csv
 import base64
-import uuid
-import datetime # Add this line
-from collections import defaultdict
+import asyncio
+from typing import Any, List, Optional
+from market import DEFAULT_REGION, MarketForecastService, check_weeks, longest_valid_weeks
+from batch import BATCH_MAX_ROWS, check_batch_size, done_line, iter_batch, ndjson, parse_csv, run_batch, summarize
+from microbatch import MicroBatcher
+from imaging import decode_image
+from weather import WeatherClient
+from weather_daily import summarize_daily
+from registry import MODEL_LOADING, ModelRegistry
+from inference import InferenceExecutor, Overloaded
+from tabular import TabularModel
+from soil_index import index_path, open_index
+from cache import create_result_cache
+from advisory import YIELD_CROP_NAMES, Stage, run_stages
+from dedup import DedupCache
+from lite import lite_model_path
+from ranking import check_top_k
+from schemas import (CropYieldInput, CropYieldScenarioInput, FertilizerRecommendationInput, MarketSeriesRequest, SoilCropRecommendationInput,
+                     crop_yield_results, disease_result, fertilizer_results, soil_crop_results)
+from jobs import FINISHED, JOB_MAX_IMAGES, JobRunner, JobStore, extract_archive, save_uploads
+from metrics import PROFILER, REGISTRY, MetricsMiddleware, span
 
 app = FastAPI()
 
@@ -34,96 +51,584 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last, so it wraps CORS and latency includes it. Starlette's ServerErrorMiddleware
+# still sits outside it: an unhandled exception reaches it as a raise and is counted as a 500.
+app.add_middleware(MetricsMiddleware)
 
-# Load models
-CROP_YIELD_MODEL = joblib.load('Trained_models/CROP_YIELD_MODEL.joblib')
-SOIL_CROP_RECOMMENDATION_MODEL = joblib.load('Trained_models/Soil_crop_recom.joblib')
-DISEASE_DETECTION_MODEL = load_model('Trained_models/CNN/Disease_Detection_model[CNN].h5')
-DISEASE_CLASSES = np.load('Trained_models/CNN/disease_classes.npy', allow_pickle=True)
-FERTILIZER_RECOMMENDATION_MODEL = joblib.load('Trained_models/fertilizer_recommendation_model.joblib')
+# Model paths
+CROP_YIELD_MODEL_PATH = 'Trained_models/CROP_YIELD_MODEL.joblib'
+SOIL_CROP_MODEL_PATH = 'Trained_models/Soil_crop_recom.joblib'
+DISEASE_MODEL_PATH = 'Trained_models/CNN/Disease_Detection_model[CNN].h5'
+DISEASE_CLASSES_PATH = 'Trained_models/CNN/disease_classes.npy'
+FERTILIZER_MODEL_PATH = 'Trained_models/fertilizer_recommendation_model.joblib'
 
 # Load LSTM Weather Forecast Model and preprocessing tools
 load_dotenv()
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 # OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+# Pooled async OpenWeather client with geocode/forecast caching
+WEATHER_CLIENT = WeatherClient(WEATHER_API_KEY)
 MARKET_MODEL_PATH = 'Trained_models/lstm_model.keras'
 MARKET_DATA_PATH = 'Datasets/central_india_weekly_crop_prices.csv'
+# One memory-mapped price store per region (Datasets/price_store/<region>/); central_india is
+# ingested from MARKET_DATA_PATH on first load. Add regions or weeks with pricestore.py
+MARKET_STORE_ROOT = 'Datasets/price_store'
+MARKET_BATCH_MAX_SERIES = int(os.getenv("MARKET_BATCH_MAX_SERIES", "1000"))
+
+# CROPIX_MODEL_RUNTIME=tflite serves the optimized exports from export_models.py instead
+if serving.MODEL_RUNTIME == "tflite":
+    DISEASE_MODEL_PATH = lite_model_path("disease_cnn")
+    MARKET_MODEL_PATH = lite_model_path("market_lstm")
+
+
+def load_soil_model():
+    # KNN queries go through the tuned KD-tree saved next to the artifact (built on first load)
+    model = serving.load_joblib(SOIL_CROP_MODEL_PATH)
+    return TabularModel(model, index=open_index(SOIL_CROP_MODEL_PATH, model))
+
+
+def load_market_service():
+    # Market LSTM, price history and scaler are loaded once and hot-reloaded on file change
+    serving.configure_tensorflow()
+    service = MarketForecastService(MARKET_MODEL_PATH, MARKET_STORE_ROOT, sources={"central_india": MARKET_DATA_PATH})
+    service.load()
+    return service
+
+
+# Every artifact is loaded once, either on first use or in parallel at startup (MODEL_LOADING)
+MODELS = ModelRegistry()
+MODELS.register("crop_yield", lambda: TabularModel(serving.load_joblib(CROP_YIELD_MODEL_PATH)),
+                ["/predict_crop_yield/", "/predict_crop_yield/scenarios", "/batch/predict_crop_yield/", "/field_advisory/"],
+                [CROP_YIELD_MODEL_PATH])
+MODELS.register("soil_crop", load_soil_model,
+                ["/recommend_soil_crop/", "/batch/recommend_soil_crop/", "/field_advisory/"],
+                [SOIL_CROP_MODEL_PATH, index_path(SOIL_CROP_MODEL_PATH)])
+MODELS.register("fertilizer", lambda: TabularModel(serving.load_joblib(FERTILIZER_MODEL_PATH)),
+                ["/recommend_fertilizer/", "/batch/recommend_fertilizer/", "/field_advisory/"], [FERTILIZER_MODEL_PATH])
+MODELS.register("disease_cnn", lambda: serving.load_keras_model(DISEASE_MODEL_PATH),
+                ["/detect_disease/", "/batch/detect_disease/upload"], [DISEASE_MODEL_PATH])
+MODELS.register("disease_classes", lambda: np.load(DISEASE_CLASSES_PATH, allow_pickle=True),
+                ["/detect_disease/", "/batch/detect_disease/upload"], [DISEASE_CLASSES_PATH])
+MODELS.register("market", load_market_service, ["/forecast_market_prices/", "/forecast_market_prices/batch"],
+                [MARKET_MODEL_PATH, os.path.join(MARKET_STORE_ROOT, DEFAULT_REGION, "meta.json")])
+
+# scikit-learn/XGBoost artifacts that are safe to load before fork (TF models are not)
+SHARED_MODELS = ["crop_yield", "soil_crop", "fertilizer", "disease_classes"]
+if serving.PRELOAD_SHARED_MODELS:
+    # Running under gunicorn --preload: load in the master so workers share the pages
+    MODELS.warm(SHARED_MODELS, wait=True)
+    gc.freeze()  # Keep the GC from dirtying (and so copying) the shared objects
+
+# Blocking model calls run on per-model thread pools, never on the event loop.
+# When a pool's queue is full the request gets 503 + Retry-After instead of waiting.
+INFERENCE = InferenceExecutor()
+INFERENCE.add_pool("crop_yield", workers=2, max_queue=64)
+INFERENCE.add_pool("soil_crop", workers=2, max_queue=64)
+INFERENCE.add_pool("fertilizer", workers=2, max_queue=64)
+INFERENCE.add_pool("market", workers=1, max_queue=32)
+INFERENCE.add_pool("image_decode", workers=4, max_queue=64, stage="preprocess")
+
+
+# Responses of the deterministic endpoints, keyed by input hash + model version (RESULT_CACHE_BACKEND)
+RESULT_CACHE = create_result_cache()
+MODELS.on_reload(RESULT_CACHE.invalidate)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
-@app.get("/")
-async def root():
-    return {"message": "Welcome to the CROPIX API!"}
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
 
-class CropYieldInput(BaseModel):
-    Crop: str
-    Season: str
-    Area: float
-    Fertilizer: float
-    Crop_Year: int
-    Pesticide: float
-    Annual_Rainfall: float
+async def run_pool_step(name, step):
+    """Run one blocking step of a stream on a model pool, waiting out 503s instead of failing."""
+    while True:
+        try:
+            return await INFERENCE.run(name, step)
+        except Overloaded as e:
+            # Headers are already sent, so back off rather than cut the stream
+            await asyncio.sleep(e.retry_after)
+
+
+async def batch_response(name, rows, schema, predict_chunk, stream=False):
+    """Run a tabular batch on the model's pool; with stream, send NDJSON lines chunk by chunk."""
+    if not stream:
+        return await INFERENCE.run(name, run_batch, rows, schema, predict_chunk)
+    too_large = check_batch_size(rows)
+    if too_large:
+        return too_large
+    chunks = iter_batch(rows, schema, predict_chunk)
+    # The first chunk runs before the response starts, so a full pool still answers 503
+    first = await INFERENCE.run(name, next, chunks, None)
+
+    async def lines():
+        count = errors = 0
+        chunk = first
+        while chunk is not None:
+            for result in chunk:
+                errors += "error" in result
+                yield ndjson(result)
+            count += len(chunk)
+            chunk = await run_pool_step(name, lambda: next(chunks, None))
+        yield done_line(count, errors)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@app.on_event("startup")
+async def startup():
+    if MODEL_LOADING == "eager":
+        # Runs in background threads; the API accepts requests while models warm up
+        MODELS.warm()
+    # Also resumes jobs left unfinished by a previous run
+    DISEASE_JOBS.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await WEATHER_CLIENT.aclose()
+    await DISEASE_JOBS.stop()
+
+
+@app.get("/")
+async def root():
+    return {
+        "message": "Welcome to the CROPIX API!",
+        "endpoints": MODELS.endpoint_status(),
+        "models": MODELS.status(),
+    }
 
 
 @app.post("/predict_crop_yield/")
 async def predict_crop_yield(input: CropYieldInput):
-    df_input = pd.DataFrame([input.dict()])
-    prediction = CROP_YIELD_MODEL.predict(df_input)[0]
-    return {"predicted_yield": prediction.item()}
+    records = [input.dict()]
+
+    async def compute():
+        prediction = await INFERENCE.run("crop_yield", lambda: MODELS.get("crop_yield").predict_records(records)[0])
+        return {"predicted_yield": prediction.item()}
+
+    return await RESULT_CACHE.get_or_compute("crop_yield", MODELS.version("crop_yield"), records[0], compute)
+
+
+def predict_crop_yield_chunk(records):
+    return crop_yield_results(MODELS.get("crop_yield"), records)
+
+
+@app.post("/batch/predict_crop_yield/")
+async def batch_predict_crop_yield(rows: List[Any], stream: bool = False):
+    return await batch_response("crop_yield", rows, CropYieldInput, predict_crop_yield_chunk, stream)
+
+
+@app.post("/batch/predict_crop_yield/csv")
+async def batch_predict_crop_yield_csv(file: UploadFile = File(...), stream: bool = False):
+    try:
+        rows = parse_csv(await file.read())
+    except ValueError as e:
+        return {"error": str(e)}
+    return await batch_response("crop_yield", rows, CropYieldInput, predict_crop_yield_chunk, stream)
+
+
+# Numeric CropYieldInput fields a scenario may sweep, and the largest grid scored per request
+SCENARIO_FIELDS = ("Area", "Fertilizer", "Crop_Year", "Pesticide", "Annual_Rainfall")
+SCENARIO_MAX_POINTS = int(os.getenv("SCENARIO_MAX_POINTS", "100000"))
 
 
-class SoilCropRecommendationInput(BaseModel):
-    N: float
-    P: float
-    K: float
-    temperature: float
-    humidity: float
-    ph: float
-    rainfall: float
+def crop_yield_scenarios(base, grid):
+    # The whole Cartesian product is one array and one predict call
+    predictions = np.asarray(MODELS.get("crop_yield").predict_grid(base, grid), dtype=np.float64)
+    shape = [len(values) for values in grid.values()]
+    best = int(np.argmax(predictions))
+    point = np.unravel_index(best, shape)
+    best_input = dict(base)
+    for (field, values), position in zip(grid.items(), point):
+        best_input[field] = int(values[position]) if field == "Crop_Year" else float(values[position])
+    return {
+        "axes": [{"field": field, "values": (values.astype(int) if field == "Crop_Year" else values).tolist()}
+                 for field, values in grid.items()],
+        "shape": shape,
+        # Nested lists in axis order; 4 decimals keeps a 10,000-point surface small
+        "predicted_yield": np.round(predictions, 4).reshape(shape).tolist(),
+        "best": {"input": best_input, "index": [int(position) for position in point],
+                 "predicted_yield": float(predictions[best])},
+        "count": int(predictions.size),
+    }
+
+
+@app.post("/predict_crop_yield/scenarios")
+async def predict_crop_yield_scenarios(input: CropYieldScenarioInput):
+    fields = [axis.field for axis in input.axes]
+    if not fields:
+        return {"error": "Give at least one axis to sweep."}
+    for field in fields:
+        if field not in SCENARIO_FIELDS:
+            return {"error": f"Cannot sweep '{field}'; choose from {', '.join(SCENARIO_FIELDS)}."}
+    if len(set(fields)) != len(fields):
+        return {"error": "Each field can only be swept by one axis."}
+    points = math.prod(axis.size() for axis in input.axes)
+    if points < 1 or points > SCENARIO_MAX_POINTS:
+        return {"error": f"A scenario must have between 1 and {SCENARIO_MAX_POINTS} grid points (got {points})."}
+    grid = {}
+    for axis in input.axes:
+        try:
+            grid[axis.field] = axis.grid_values()
+        except ValueError as e:
+            return {"error": str(e)}
+        if axis.field == "Crop_Year" and not np.array_equal(grid[axis.field], np.round(grid[axis.field])):
+            return {"error": "Crop_Year values must be whole years."}
+    base = input.base.dict()
+
+    async def compute():
+        return await INFERENCE.run("crop_yield", crop_yield_scenarios, base, grid)
+
+    return await RESULT_CACHE.get_or_compute("crop_yield", MODELS.version("crop_yield"),
+                                             {"scenario": input.dict()}, compute)
 
 
 @app.post("/recommend_soil_crop/")
-async def recommend_soil_crop(input: SoilCropRecommendationInput):
-    df_input = pd.DataFrame([input.dict()])
-    prediction_label = SOIL_CROP_RECOMMENDATION_MODEL.predict(df_input)[0]
-    return {"recommended_crop": prediction_label}
+async def recommend_soil_crop(input: SoilCropRecommendationInput, top_k: Optional[int] = None):
+    invalid = check_top_k(top_k)
+    if invalid:
+        return invalid
+    records = [input.dict()]
+
+    async def compute():
+        if top_k is not None:
+            return await INFERENCE.run("soil_crop", lambda: recommend_soil_crop_chunk(records, top_k)[0])
+        prediction_label = await INFERENCE.run("soil_crop", lambda: MODELS.get("soil_crop").predict_records(records)[0])
+        return {"recommended_crop": str(prediction_label)}
+
+    payload = records[0] if top_k is None else {**records[0], "top_k": top_k}
+    return await RESULT_CACHE.get_or_compute("soil_crop", MODELS.version("soil_crop"), payload, compute)
+
+
+def recommend_soil_crop_chunk(records, top_k=None):
+    return soil_crop_results(MODELS.get("soil_crop"), records, top_k)
+
+
+@app.post("/batch/recommend_soil_crop/")
+async def batch_recommend_soil_crop(rows: List[Any], stream: bool = False, top_k: Optional[int] = None):
+    invalid = check_top_k(top_k)
+    if invalid:
+        return invalid
+    predict_chunk = functools.partial(recommend_soil_crop_chunk, top_k=top_k)
+    return await batch_response("soil_crop", rows, SoilCropRecommendationInput, predict_chunk, stream)
+
+
+@app.post("/batch/recommend_soil_crop/csv")
+async def batch_recommend_soil_crop_csv(file: UploadFile = File(...), stream: bool = False,
+                                        top_k: Optional[int] = None):
+    invalid = check_top_k(top_k)
+    if invalid:
+        return invalid
+    try:
+        rows = parse_csv(await file.read())
+    except ValueError as e:
+        return {"error": str(e)}
+    predict_chunk = functools.partial(recommend_soil_crop_chunk, top_k=top_k)
+    return await batch_response("soil_crop", rows, SoilCropRecommendationInput, predict_chunk, stream)
+
+
+def predict_disease_batch(img_batch):
+    return np.asarray(MODELS.get("disease_cnn").predict_on_batch(img_batch))
+
+
+# Concurrent /detect_disease/ requests share one CNN forward pass
+DISEASE_BATCHER = MicroBatcher(
+    predict_disease_batch,
+    max_batch_size=int(os.getenv("DISEASE_MAX_BATCH_SIZE", "16")),
+    max_wait_ms=float(os.getenv("DISEASE_MAX_WAIT_MS", "10")),
+    max_queue=int(os.getenv("DISEASE_MAX_QUEUE", "128")),
+    name="disease-cnn",
+)
+# Repeated uploads of the same photo reuse one CNN output (DISEASE_DEDUP_MODE)
+DISEASE_DEDUP = DedupCache()
+MODELS.on_reload(lambda name: DISEASE_DEDUP.clear() if name == "disease_cnn" else None)
+
+
+async def decode_disease_image(image_data):
+    return await INFERENCE.run("image_decode", decode_image, image_data)
+
+
+async def infer_disease_image(img_array):
+    with span("inference"):
+        return await DISEASE_BATCHER.submit(img_array)
 
 
 class DiseaseDetectionInput(BaseModel):
     image_base64: str
 
 
+async def detect_disease_bytes(image_data, top_k=None):
+    try:
+        # Decode in memory and predict batched with other in-flight requests, unless the same
+        # image was already seen or is being processed for another request
+        predictions = await DISEASE_DEDUP.get_or_compute(
+            MODELS.version("disease_cnn"), image_data, decode_disease_image, infer_disease_image)
+        return disease_result(predictions, MODELS.get("disease_classes"), top_k)
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
+
+
 @app.post("/detect_disease/")
-async def detect_disease(input: DiseaseDetectionInput):
+async def detect_disease(input: DiseaseDetectionInput, top_k: Optional[int] = None):
+    invalid = check_top_k(top_k)
+    if invalid:
+        return invalid
     try:
         # Decode the base64 string
-        image_data = base64.b64decode(input.image_base64)
-        image = Image.open(io.BytesIO(image_data))
+        with span("decode"):
+            image_data = base64.b64decode(input.image_base64)
+    except Exception as e:
+        return {"error": str(e)}
+    return await detect_disease_bytes(image_data, top_k)
+
+
+@app.post("/detect_disease/upload")
+async def detect_disease_upload(file: UploadFile = File(...), top_k: Optional[int] = None):
+    # Multipart upload skips the base64 inflation of /detect_disease/
+    invalid = check_top_k(top_k)
+    if invalid:
+        return invalid
+    return await detect_disease_bytes(await file.read(), top_k)
+
+
+@app.post("/detect_disease/raw")
+async def detect_disease_raw(request: Request, top_k: Optional[int] = None):
+    # Raw image bytes as the request body (e.g. Content-Type: image/jpeg)
+    invalid = check_top_k(top_k)
+    if invalid:
+        return invalid
+    return await detect_disease_bytes(await request.body(), top_k)
+
+
+# Images decoded/queued at once per bulk request; the micro-batcher groups them into CNN passes
+DISEASE_BULK_CONCURRENCY = int(os.getenv("DISEASE_BULK_CONCURRENCY", "32"))
+
+
+async def detect_disease_files(files, top_k=None):
+    """Yield one result per uploaded image, in completion order, each tagged with its index."""
+    semaphore = asyncio.Semaphore(DISEASE_BULK_CONCURRENCY)
+
+    async def detect(index, file):
+        async with semaphore:
+            image_data = await file.read()
+            while True:
+                try:
+                    result = await detect_disease_bytes(image_data, top_k)
+                    break
+                except Overloaded as e:
+                    await asyncio.sleep(e.retry_after)
+        return {"index": index, "filename": file.filename, **result}
+
+    for task in asyncio.as_completed([detect(index, file) for index, file in enumerate(files)]):
+        yield await task
+
+
+@app.post("/batch/detect_disease/upload")
+async def batch_detect_disease_upload(request: Request, stream: bool = False, top_k: Optional[int] = None):
+    invalid = check_top_k(top_k)
+    if invalid:
+        return invalid
+    # Multipart form with one or more "files" parts. Parsed here rather than with File(...) so the
+    # uploads stay open while a streamed response is still being produced.
+    form = await request.form(max_files=BATCH_MAX_ROWS)
+    files = [item for item in form.getlist("files") if hasattr(item, "read")]
+    if not files:
+        await form.close()
+        return {"error": "Upload one or more images as 'files'."}
+
+    if not stream:
+        try:
+            results = [result async for result in detect_disease_files(files, top_k)]
+        finally:
+            await form.close()
+        return summarize(sorted(results, key=lambda result: result["index"]))
+
+    async def lines():
+        errors = 0
+        try:
+            async for result in detect_disease_files(files, top_k):
+                errors += "error" in result
+                yield ndjson(result)
+        finally:
+            await form.close()
+        yield done_line(len(files), errors)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+# Bulk screening jobs (drone / field-survey image sets), persisted under DISEASE_JOBS_DIR
+JOB_STORE = JobStore()
+DISEASE_JOBS = JobRunner(JOB_STORE, predict_disease_batch, lambda: MODELS.get("disease_classes"))
+JOB_RESULT_FIELDS = ["index", "filename", "predicted_disease", "confidence", "error"]
+
+
+@app.post("/jobs/detect_disease")
+async def submit_disease_job(request: Request):
+    # Multipart form with either one "archive" part (.zip / .tar[.gz]) or several "files" parts
+    form = await request.form(max_files=JOB_MAX_IMAGES + 1)
+    archive = form.get("archive")
+    files = [item for item in form.getlist("files") if hasattr(item, "read")]
+    try:
+        if hasattr(archive, "read"):
+            job = await run_in_threadpool(
+                JOB_STORE.create, lambda images_dir: extract_archive(archive.file, archive.filename, images_dir))
+        elif files:
+            job = await run_in_threadpool(JOB_STORE.create, lambda images_dir: save_uploads(files, images_dir))
+        else:
+            return {"error": "Upload an 'archive' or one or more 'files'."}
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        await form.close()
+    DISEASE_JOBS.submit(job["id"])
+    return job
 
-        # Save temporarily in /tmp (Hugging Face writable dir)
-        temp_filename = f"temp_image_{uuid.uuid4()}.png"
-        temp_filepath = os.path.join("/tmp", temp_filename)
-        image.save(temp_filepath)
 
-        # Preprocess
-        img = tf.keras.preprocessing.image.load_img(temp_filepath, target_size=(256, 256))  # type: ignore
-        img_array = tf.keras.preprocessing.image.img_to_array(img)  # type: ignore
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array /= 255.0
+@app.get("/jobs/{job_id}")
+async def disease_job_status(job_id: str):
+    try:
+        job = await run_in_threadpool(JOB_STORE.read, job_id)
+    except KeyError:
+        return {"error": f"Unknown job '{job_id}'."}
+    return {**job, "progress": round(job["processed"] / job["total"], 4)}
 
-        # Predict
-        predictions = DISEASE_DETECTION_MODEL.predict(img_array)
-        predicted_class_index = np.argmax(predictions)
-        predicted_class = DISEASE_CLASSES[predicted_class_index]
-        confidence = float(np.max(predictions))
 
-        # Clean up
-        os.remove(temp_filepath)
+@app.get("/jobs/{job_id}/results")
+async def disease_job_results(job_id: str, format: str = "json"):
+    try:
+        job = await run_in_threadpool(JOB_STORE.read, job_id)
+        results = await run_in_threadpool(JOB_STORE.results, job_id)
+    except KeyError:
+        return {"error": f"Unknown job '{job_id}'."}
+    if format == "csv":
+        def rows():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=JOB_RESULT_FIELDS)
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+
+        return StreamingResponse(rows(), media_type="text/csv",
+                                 headers={"Content-Disposition": f'attachment; filename="{job_id}.csv"'})
+    return {"status": job["status"], **summarize(results)}
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_disease_job(job_id: str):
+    try:
+        return await run_in_threadpool(JOB_STORE.request_cancel, job_id)
+    except KeyError:
+        return {"error": f"Unknown job '{job_id}'."}
 
-        return {"predicted_disease": predicted_class, "confidence": confidence}
 
+@app.delete("/jobs/{job_id}")
+async def delete_disease_job(job_id: str):
+    try:
+        job = await run_in_threadpool(JOB_STORE.read, job_id)
+        if job["status"] not in FINISHED:
+            return {"error": "Cancel the job before deleting it."}
+        await run_in_threadpool(JOB_STORE.delete, job_id)
+    except KeyError:
+        return {"error": f"Unknown job '{job_id}'."}
+    return {"deleted": job_id}
+
+
+@app.get("/disease/metrics")
+async def disease_metrics():
+    return {**DISEASE_BATCHER.metrics(), "dedup": DISEASE_DEDUP.metrics()}
+
+
+@app.get("/cache/metrics")
+async def cache_metrics():
+    return RESULT_CACHE.metrics()
+
+
+# Gauges that mirror state kept by other components, refreshed on every scrape
+MODEL_READY = REGISTRY.gauge("cropix_model_ready", "1 if the model is loaded", ["model"])
+POOL_PENDING = REGISTRY.gauge("cropix_inference_pending", "Calls running or queued per pool", ["pool"])
+POOL_REJECTED = REGISTRY.gauge("cropix_inference_rejected", "Calls rejected with 503 per pool", ["pool"])
+BATCHER_QUEUE = REGISTRY.gauge("cropix_batcher_queue_depth", "Items waiting for a micro-batch", ["model"])
+CACHE_EVENTS = REGISTRY.gauge("cropix_result_cache_events", "Result cache hits/misses/errors", ["namespace", "event"])
+DEDUP_EVENTS = REGISTRY.gauge("cropix_disease_dedup_events",
+                              "Disease image dedup cache hits/perceptual_hits/coalesced/misses", ["event"])
+DEDUP_BYTES_SAVED = REGISTRY.gauge("cropix_disease_dedup_bytes_saved", "Image bytes not decoded thanks to dedup")
+DEDUP_ENTRIES = REGISTRY.gauge("cropix_disease_dedup_entries", "Images held by the disease dedup cache")
+WEATHER_EVENTS = REGISTRY.gauge("cropix_weather_client_events", "OpenWeather client counters", ["event"])
+
+
+def collect_component_metrics():
+    for name, status in MODELS.status().items():
+        MODEL_READY.set(int(status["ready"]), model=name)
+    for name, status in INFERENCE.status().items():
+        POOL_PENDING.set(status["pending"], pool=name)
+        POOL_REJECTED.set(status["rejected"], pool=name)
+    BATCHER_QUEUE.set(DISEASE_BATCHER.metrics()["queue_depth"], model=DISEASE_BATCHER.name)
+    for namespace, stats in RESULT_CACHE.metrics()["namespaces"].items():
+        for event in ("hits", "misses", "errors", "invalidations"):
+            CACHE_EVENTS.set(stats[event], namespace=namespace, event=event)
+    dedup = DISEASE_DEDUP.metrics()
+    for event in ("hits", "perceptual_hits", "coalesced", "misses"):
+        DEDUP_EVENTS.set(dedup[event], event=event)
+    DEDUP_BYTES_SAVED.set(dedup["bytes_saved"])
+    DEDUP_ENTRIES.set(dedup["entries"])
+    for event, value in WEATHER_CLIENT.stats().items():
+        WEATHER_EVENTS.set(value, event=event)
+
+
+REGISTRY.add_collector(collect_component_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+# Runtime sampling profiler, only exposed when CROPIX_PROFILER=1
+if os.getenv("CROPIX_PROFILER", "0") == "1":
+    @app.post("/debug/profiler/start")
+    async def profiler_start(interval_ms: float = 5.0):
+        PROFILER.start(interval_ms)
+        return PROFILER.report(top=0)
+
+    @app.post("/debug/profiler/stop")
+    async def profiler_stop(top: int = 50):
+        await run_in_threadpool(PROFILER.stop)
+        return PROFILER.report(top)
+
+    @app.get("/debug/profiler/collapsed")
+    async def profiler_collapsed():
+        # Feed to flamegraph.pl or speedscope
+        return PlainTextResponse(PROFILER.collapsed())
+
+
+@app.post("/models/{name}/reload")
+async def reload_model(name: str):
+    if name not in MODELS.status():
+        return {"error": f"Unknown model '{name}'."}
+    try:
+        await run_in_threadpool(MODELS.reload, name)
     except Exception as e:
         return {"error": str(e)}
+    return MODELS.status()[name]
+
+
+@app.get("/inference/status")
+async def inference_status():
+    return {**INFERENCE.status(), "disease_cnn": DISEASE_BATCHER.metrics()}
 
 
 class LSTMWeatherForecastInput(BaseModel):
@@ -137,53 +642,28 @@ async def weather_forecast_lstm(input: LSTMWeatherForecastInput):
         return {"error": "OpenWeather API key not found."}
 
     # Geocoding: Convert city name to latitude and longitude using OpenWeatherMap Geocoding API
-    geocode_url = f"http://api.openweathermap.org/geo/1.0/direct?q={input.city}&limit=1&appid={WEATHER_API_KEY}"
-    geocode_response = requests.get(geocode_url)
-    geocode_response.raise_for_status()
-    geocode_data = geocode_response.json()
+    coordinates = await WEATHER_CLIENT.geocode(input.city)
 
-    if not geocode_data:
+    if not coordinates:
         return {"error": f"Could not find coordinates for city: {input.city}"}
 
-    lat = geocode_data[0]["lat"]
-    lon = geocode_data[0]["lon"]
+    lat, lon = coordinates
 
     # OpenWeatherMap 5-day / 3-hour forecast (free tier)
     # The free tier of OpenWeatherMap provides a 5-day / 3-hour forecast.
     # It has a free limit of 1,000,000 calls/month.
-    url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&appid={WEATHER_API_KEY}"
-
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()["list"]
-
-    daily_forecasts = defaultdict(lambda: {"min_temp": float('inf'), "max_temp": float('-inf'), "humidity_sum": 0, "pop_sum": 0, "count": 0, "condition": ""})
-
-    for item in data:
-        date = datetime.datetime.fromtimestamp(item["dt"]).strftime("%Y-%m-%d")
-        daily_forecasts[date]["min_temp"] = min(daily_forecasts[date]["min_temp"], item["main"]["temp_min"])
-        daily_forecasts[date]["max_temp"] = max(daily_forecasts[date]["max_temp"], item["main"]["temp_max"])
-        daily_forecasts[date]["humidity_sum"] += item["main"]["humidity"]
-        daily_forecasts[date]["pop_sum"] += item.get("pop", 0) # Probability of precipitation
-        daily_forecasts[date]["count"] += 1
-        # Take the condition from the first entry of the day, or most frequent
-        if not daily_forecasts[date]["condition"]:
-            daily_forecasts[date]["condition"] = item["weather"][0]["description"]
-
-    forecast_summary = []
-    for date, values in sorted(daily_forecasts.items())[:input.days]: # Limit to requested days
-        forecast_summary.append({
-            "date": date,
-            "min_temp_c": round(values["min_temp"], 2),
-            "max_temp_c": round(values["max_temp"], 2),
-            "avg_temp_c": round((values["min_temp"] + values["max_temp"]) / 2, 2), # Approximate average
-            "avg_humidity": round(values["humidity_sum"] / values["count"], 2),
-            "chance_of_rain": round(values["pop_sum"] / values["count"] * 100, 2),
-            "condition": values["condition"]
-        })
+    payload = await WEATHER_CLIENT.forecast(lat, lon)
+
+    # Roll the 3-hour slots up into local-time days
+    forecast_summary = summarize_daily([payload], input.days)[0]
     return {"forecast": forecast_summary, "city_name": input.city}
 
 
+@app.get("/weather/stats")
+async def weather_stats():
+    return WEATHER_CLIENT.stats()
+
+
 class WeatherForecastInput(BaseModel):
     city: str
     days: int
@@ -195,109 +675,240 @@ async def weather_forecast(input: WeatherForecastInput):
         return {"error": "OpenWeather API key not found."}
 
     # Geocoding: Convert city name to latitude and longitude using OpenWeatherMap Geocoding API
-    geocode_url = f"http://api.openweathermap.org/geo/1.0/direct?q={input.city}&limit=1&appid={WEATHER_API_KEY}"
-    geocode_response = requests.get(geocode_url)
-    geocode_response.raise_for_status()
-    geocode_data = geocode_response.json()
+    coordinates = await WEATHER_CLIENT.geocode(input.city)
 
-    if not geocode_data:
+    if not coordinates:
         return {"error": f"Could not find coordinates for city: {input.city}"}
 
-    lat = geocode_data[0]["lat"]
-    lon = geocode_data[0]["lon"]
+    lat, lon = coordinates
 
     # OpenWeatherMap 5-day / 3-hour forecast (free tier)
     # The free tier of OpenWeatherMap provides a 5-day / 3-hour forecast.
     # It has a free limit of 1,000,000 calls/month.
-    url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&appid={WEATHER_API_KEY}"
-
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()["list"]
-
-    daily_forecasts = defaultdict(lambda: {"min_temp": float('inf'), "max_temp": float('-inf'), "humidity_sum": 0, "pop_sum": 0, "count": 0, "condition": ""})
-
-    for item in data:
-        date = datetime.datetime.fromtimestamp(item["dt"]).strftime("%Y-%m-%d")
-        daily_forecasts[date]["min_temp"] = min(daily_forecasts[date]["min_temp"], item["main"]["temp_min"])
-        daily_forecasts[date]["max_temp"] = max(daily_forecasts[date]["max_temp"], item["main"]["temp_max"])
-        daily_forecasts[date]["humidity_sum"] += item["main"]["humidity"]
-        daily_forecasts[date]["pop_sum"] += item.get("pop", 0) # Probability of precipitation
-        daily_forecasts[date]["count"] += 1
-        # Take the condition from the first entry of the day, or most frequent
-        if not daily_forecasts[date]["condition"]:
-            daily_forecasts[date]["condition"] = item["weather"][0]["description"]
-
-    forecast_summary = []
-    for date, values in sorted(daily_forecasts.items())[:input.days]: # Limit to requested days
-        forecast_summary.append({
-            "date": date,
-            "min_temp_c": round(values["min_temp"], 2),
-            "max_temp_c": round(values["max_temp"], 2),
-            "avg_temp_c": round((values["min_temp"] + values["max_temp"]) / 2, 2), # Approximate average
-            "avg_humidity": round(values["humidity_sum"] / values["count"], 2),
-            "chance_of_rain": round(values["pop_sum"] / values["count"] * 100, 2),
-            "condition": values["condition"]
-        })
+    payload = await WEATHER_CLIENT.forecast(lat, lon)
+
+    # Roll the 3-hour slots up into local-time days
+    forecast_summary = summarize_daily([payload], input.days)[0]
     return {"forecast": forecast_summary, "city_name": input.city}
 
 
-class FertilizerRecommendationInput(BaseModel):
-    Crop: str
-    Current_N: float
-    Current_P: float
-    Current_K: float
+class BulkWeatherForecastInput(BaseModel):
+    cities: List[str]
+    days: int
+
+
+# Most distinct cities one bulk request may look up
+WEATHER_BULK_MAX_CITIES = int(os.getenv("WEATHER_BULK_MAX_CITIES", "100"))
+
+
+@app.post("/weather_forecast/bulk")
+async def weather_forecast_bulk(input: BulkWeatherForecastInput):
+    if not WEATHER_API_KEY:
+        return {"error": "OpenWeather API key not found."}
+    cities = list(dict.fromkeys(input.cities))  # A repeated city is looked up once
+    if not 1 <= len(cities) <= WEATHER_BULK_MAX_CITIES:
+        return {"error": f"A bulk forecast must name between 1 and {WEATHER_BULK_MAX_CITIES} distinct cities."}
+
+    # A failed lookup becomes that city's error instead of failing the whole request
+    results, found = {}, []
+    coordinates = await asyncio.gather(*(WEATHER_CLIENT.geocode(city) for city in cities), return_exceptions=True)
+    for city, coords in zip(cities, coordinates):
+        if isinstance(coords, BaseException):
+            results[city] = {"error": str(coords)}
+        elif not coords:
+            results[city] = {"error": f"Could not find coordinates for city: {city}"}
+        else:
+            found.append((city, coords))
+    payloads = await asyncio.gather(*(WEATHER_CLIENT.forecast(lat, lon) for _, (lat, lon) in found),
+                                    return_exceptions=True)
+    fetched = []
+    for (city, _), payload in zip(found, payloads):
+        if isinstance(payload, BaseException):
+            results[city] = {"error": str(payload)}
+        else:
+            fetched.append((city, payload))
+
+    # Aggregate every location in a single pass
+    summaries = summarize_daily([payload for _, payload in fetched], input.days)
+    results.update({city: {"forecast": summary} for (city, _), summary in zip(fetched, summaries)})
+    return {"forecasts": [{"city_name": city, **results[city]} for city in input.cities]}
 
 
 @app.post("/recommend_fertilizer/")
 async def recommend_fertilizer(input: FertilizerRecommendationInput):
-    df_input = pd.DataFrame([input.dict()])
-    prediction = FERTILIZER_RECOMMENDATION_MODEL.predict(df_input)[0]
-    return {
-        "recommended_N": prediction[0].item(),
-        "recommended_P": prediction[1].item(),
-        "recommended_K": prediction[2].item()
-    }
+    records = [input.dict()]
+
+    async def compute():
+        prediction = await INFERENCE.run("fertilizer", lambda: MODELS.get("fertilizer").predict_records(records)[0])
+        return {
+            "recommended_N": prediction[0].item(),
+            "recommended_P": prediction[1].item(),
+            "recommended_K": prediction[2].item()
+        }
+
+    return await RESULT_CACHE.get_or_compute("fertilizer", MODELS.version("fertilizer"), records[0], compute)
+
+
+def recommend_fertilizer_chunk(records):
+    return fertilizer_results(MODELS.get("fertilizer"), records)
+
+
+@app.post("/batch/recommend_fertilizer/")
+async def batch_recommend_fertilizer(rows: List[Any], stream: bool = False):
+    return await batch_response("fertilizer", rows, FertilizerRecommendationInput, recommend_fertilizer_chunk, stream)
+
+
+@app.post("/batch/recommend_fertilizer/csv")
+async def batch_recommend_fertilizer_csv(file: UploadFile = File(...), stream: bool = False):
+    try:
+        rows = parse_csv(await file.read())
+    except ValueError as e:
+        return {"error": str(e)}
+    return await batch_response("fertilizer", rows, FertilizerRecommendationInput, recommend_fertilizer_chunk, stream)
+
+
+class FieldConditions(BaseModel):
+    """Crop yield inputs other than the crop, which comes from the soil recommendation."""
+    Season: str
+    Area: float
+    Fertilizer: float
+    Crop_Year: int
+    Pesticide: float
+    Annual_Rainfall: float
+
+
+class FieldAdvisoryInput(BaseModel):
+    soil: SoilCropRecommendationInput
+    field: Optional[FieldConditions] = None
+    city: Optional[str] = None
+    days: int = 5
+
+
+@app.post("/field_advisory/")
+async def field_advisory(input: FieldAdvisoryInput):
+    # The stages call the single-model endpoints in-process, so they share their pools and cached results
+    async def soil_crop():
+        return await recommend_soil_crop(input.soil)
+
+    async def fertilizer(soil_crop):
+        return await recommend_fertilizer(FertilizerRecommendationInput(
+            Crop=soil_crop["recommended_crop"], Current_N=input.soil.N, Current_P=input.soil.P, Current_K=input.soil.K))
+
+    async def crop_yield(soil_crop):
+        crop = YIELD_CROP_NAMES.get(soil_crop["recommended_crop"])
+        if crop is None:
+            return {"error": f"No yield data for crop: {soil_crop['recommended_crop']}"}
+        prediction = await predict_crop_yield(CropYieldInput(Crop=crop, **input.field.dict()))
+        return {"crop": crop, **prediction}
+
+    async def weather():
+        return await weather_forecast(WeatherForecastInput(city=input.city, days=input.days))
+
+    stages = [Stage("soil_crop", soil_crop), Stage("fertilizer", fertilizer, after=["soil_crop"])]
+    if input.field is not None:
+        stages.append(Stage("crop_yield", crop_yield, after=["soil_crop"]))
+    if input.city:
+        stages.append(Stage("weather", weather))
+    results, timings = await run_stages(stages)
+    return {**results, "timings": timings}
 
 
 class MarketPriceForecastInput(BaseModel):
     crop_name: str
     weeks_to_forecast: int
+    region: str = DEFAULT_REGION
+
+
+async def market_week_lines(snapshot, region, crop, weeks):
+    # Weeks already in the cached horizon go out at once; beyond it the horizon is
+    # doubled step by step, so the first lines do not wait for the full rollout
+    sent = 0
+    while sent < weeks:
+        ready = min(weeks, snapshot.cached_weeks)
+        if ready <= sent:
+            await run_pool_step("market", lambda: snapshot.ensure_horizon(min(weeks, max(1, 2 * sent))))
+            continue
+        for date, price in snapshot.series(region, crop, ready, start=sent).items():
+            yield ndjson({"date": date, "price": price})
+        sent = ready
+    yield done_line(max(weeks, 0), 0)
 
 
 @app.post("/forecast_market_prices/")
-async def forecast_market_prices(input: MarketPriceForecastInput):
-    model = load_model(MARKET_MODEL_PATH)
-    df_historical = pd.read_csv(MARKET_DATA_PATH, index_col='Date', parse_dates=True)
+async def forecast_market_prices(input: MarketPriceForecastInput, stream: bool = False):
+    snapshot = await INFERENCE.run("market", lambda: MODELS.get("market").get())
 
-    if input.crop_name not in df_historical.columns:
+    if input.crop_name not in snapshot.crops:
         return {"error": f"Crop '{input.crop_name}' not found in historical data."}
+    if input.region not in snapshot.regions:
+        return {"error": f"Region '{input.region}' not found."}
+    invalid = check_weeks(input.weeks_to_forecast)
+    if invalid:
+        return invalid
+    if stream:
+        return StreamingResponse(market_week_lines(snapshot, input.region, input.crop_name, input.weeks_to_forecast),
+                                 media_type=NDJSON_MEDIA_TYPE)
 
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(df_historical)
+    df_forecast = await INFERENCE.run("market", snapshot.forecast, input.weeks_to_forecast, input.region)
 
-    n_steps = 8  # Must match training config
-    n_features = df_historical.shape[1]
-    last_known_data = scaled_data[-n_steps:]
-    current_batch = last_known_data.reshape((1, n_steps, n_features))
+    with span("serialization"):
+        return {"forecast": df_forecast[[input.crop_name]].round(2).to_dict()}
 
-    forecast = []
-    for _ in range(input.weeks_to_forecast):
-        current_pred = model.predict(current_batch, verbose=0)[0]
-        forecast.append(current_pred)
-        current_batch = np.append(current_batch[:, 1:, :], [[current_pred]], axis=1)
 
-    forecast_prices = scaler.inverse_transform(forecast)
-    last_historical_date = df_historical.index[-1]
-    future_dates = pd.to_datetime(
-        [last_historical_date + pd.Timedelta(weeks=i) for i in range(1, input.weeks_to_forecast + 1)]
-    )
+class MarketBatchForecastInput(BaseModel):
+    requests: List[MarketSeriesRequest]
+
+
+def market_series_lines(snapshot, requests):
+    # One NDJSON line per requested series, in request order
+    errors = 0
+    for line in snapshot.series_results(requests):
+        errors += "error" in line
+        yield ndjson(line)
+    yield done_line(len(requests), errors)
+
+
+@app.post("/forecast_market_prices/batch")
+async def forecast_market_prices_batch(input: MarketBatchForecastInput):
+    if len(input.requests) > MARKET_BATCH_MAX_SERIES:
+        return {"error": f"At most {MARKET_BATCH_MAX_SERIES} series per request."}
+    snapshot = await INFERENCE.run("market", lambda: MODELS.get("market").get())
+    # Every region is rolled out together, once per snapshot/horizon; the series are then slices
+    await INFERENCE.run("market", snapshot.ensure_horizon, longest_valid_weeks(input.requests))
+    return StreamingResponse(market_series_lines(snapshot, input.requests), media_type=NDJSON_MEDIA_TYPE)
+
+
+@app.get("/market/regions")
+async def market_regions():
+    snapshot = await INFERENCE.run("market", lambda: MODELS.get("market").get())
+    return {"default_region": DEFAULT_REGION, "regions": list(snapshot.regions), "crops": snapshot.crops}
 
-    df_forecast = pd.DataFrame(forecast_prices, index=future_dates, columns=df_historical.columns)
 
-    return {"forecast": df_forecast[[input.crop_name]].round(2).to_dict()}
+@app.get("/market/health")
+async def market_health():
+    # Off the loop: with lazy loading the first get() imports TensorFlow and loads the LSTM
+    return await run_in_threadpool(lambda: MODELS.get("market").status())
 
 
-# Reload models at bottom (ensure availability)
-DISEASE_DETECTION_MODEL = tf.keras.models.load_model("Trained_models/CNN/Disease_Detection_model[CNN].h5")
-DISEASE_CLASSES = np.load("Trained_models/CNN/disease_classes.npy", allow_pickle=True)
+def reload_market(force):
+    service = MODELS.get("market")
+    try:
+        if force:
+            service.load()
+        else:
+            service.reload_if_changed()
+    except Exception as e:
+        return {"error": str(e), **service.status()}
+    return service.status()
+
+
+@app.post("/market/reload")
+async def market_reload(force: bool = False):
+    # A reload loads the LSTM and rolls out the cached horizon, so it queues with the forecasts
+    try:
+        return await INFERENCE.run("market", reload_market, force)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
+
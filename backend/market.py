@@ -0,0 +1,310 @@
+import os
+import hashlib
+import threading
+import time
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from lite import LiteModel
+from metrics import span
+from pricestore import META_FILE, PriceStore, open_store, source_state
+
+N_STEPS = 8  # Must match training config
+# Horizon computed up front for every snapshot; shorter requests are served from it
+FORECAST_HORIZON = int(os.getenv("MARKET_FORECAST_HORIZON", "52"))
+# Longest horizon a request may ask for; the cached rollout grows to the longest one served
+MARKET_MAX_WEEKS = int(os.getenv("MARKET_MAX_WEEKS", "260"))
+DEFAULT_REGION = os.getenv("MARKET_DEFAULT_REGION", "central_india")
+if not 1 <= FORECAST_HORIZON <= MARKET_MAX_WEEKS:
+    raise ValueError(f"MARKET_FORECAST_HORIZON must be between 1 and MARKET_MAX_WEEKS ({MARKET_MAX_WEEKS}).")
+
+
+def check_weeks(weeks):
+    """Return an error dict for a horizon outside 1..MARKET_MAX_WEEKS, else None."""
+    if not 1 <= weeks <= MARKET_MAX_WEEKS:
+        return {"error": f"weeks must be between 1 and {MARKET_MAX_WEEKS}."}
+    return None
+
+
+def longest_valid_weeks(requests):
+    """Longest in-range horizon among requests (objects with weeks), or 1."""
+    return max((request.weeks for request in requests if check_weeks(request.weeks) is None), default=1)
+
+
+def build_rollout(model, n_features):
+    """Compile the whole autoregressive rollout into one graph call.
+
+    The window is a fixed-shape (batch, N_STEPS, n_features) tensor that is
+    shifted in-graph each week, so there is no per-week predict() round trip.
+    """
+    import tensorflow as tf  # type: ignore
+
+    @tf.function(input_signature=[
+        tf.TensorSpec(shape=(None, N_STEPS, n_features), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.int32),
+    ])
+    def rollout(window, weeks):
+        outputs = tf.TensorArray(tf.float32, size=weeks)
+        for i in tf.range(weeks):
+            pred = model(window, training=False)
+            outputs = outputs.write(i, pred)
+            window = tf.concat([window[:, 1:, :], tf.expand_dims(pred, 1)], axis=1)
+        return tf.transpose(outputs.stack(), [1, 0, 2])  # (batch, weeks, n_features)
+
+    return rollout
+
+
+def build_lite_rollout(model):
+    """Same rollout for a TFLite export, stepping the interpreter from Python.
+
+    Each step is a sub-millisecond invoke, so a graph loop buys nothing here.
+    """
+    def rollout(window, weeks):
+        outputs = np.empty((window.shape[0], weeks, window.shape[2]), dtype=np.float32)
+        for i in range(weeks):
+            pred = model.predict_on_batch(window)
+            outputs[:, i] = pred
+            window = np.concatenate([window[:, 1:, :], pred[:, np.newaxis, :]], axis=1)
+        return outputs
+
+    return rollout
+
+
+class MarketSnapshot:
+    """One consistent set of market artifacts: model and every region's price store.
+
+    All regions share the model's crop columns. Their last N_STEPS weeks are
+    stacked into one (regions, N_STEPS, n_crops) window and rolled out in a
+    single batched call, so the cost grows with the horizon, not with the
+    number of regions. Each region keeps its own min/max scaling.
+    """
+
+    def __init__(self, model, regions, version):
+        self.model = model
+        self.regions = regions  # name -> PriceStore, memory-mapped
+        self._region_index = {name: i for i, name in enumerate(regions)}
+        self.crops = next(iter(regions.values())).columns
+        self.last_dates = {name: store.last_date for name, store in regions.items()}
+        # Per-region MinMaxScaler parameters as (regions, 1, n_crops) arrays: x * scale + offset
+        scalers = [store.scaler() for store in regions.values()]
+        self._scale = np.stack([scaler.scale_ for scaler in scalers])[:, np.newaxis, :]
+        self._offset = np.stack([scaler.min_ for scaler in scalers])[:, np.newaxis, :]
+        self.version = version
+        self.loaded_at = datetime.datetime.now(datetime.timezone.utc)
+        if isinstance(model, LiteModel):
+            self.rollout = build_lite_rollout(model)
+        else:
+            self.rollout = build_rollout(model, len(self.crops))
+        self._forecast = None  # (regions, weeks, n_crops) prices
+        self._forecast_lock = threading.Lock()
+
+    def _compute(self, weeks):
+        history = np.stack([store.tail(N_STEPS) for store in self.regions.values()])
+        windows = (history * self._scale + self._offset).astype(np.float32)
+        with span("rollout"):
+            scaled_forecast = np.asarray(self.rollout(windows, np.int32(weeks)))
+        return (scaled_forecast - self._offset) / self._scale
+
+    def ensure_horizon(self, weeks):
+        """Make sure every region is forecast at least weeks ahead; returns the cached array.
+
+        The rollout is identical for every crop and a shorter horizon is a
+        prefix of a longer one, so one cached horizon serves every request
+        for this snapshot's data/model version.
+        """
+        if weeks > MARKET_MAX_WEEKS:
+            raise ValueError(f"weeks must be at most {MARKET_MAX_WEEKS}.")
+        cached = self._forecast
+        if cached is None or cached.shape[1] < weeks:
+            with self._forecast_lock:
+                cached = self._forecast
+                if cached is None or cached.shape[1] < weeks:
+                    cached = self._compute(max(weeks, FORECAST_HORIZON))
+                    self._forecast = cached
+        return cached
+
+    def future_dates(self, region, weeks):
+        last_date = self.last_dates[region]
+        return pd.to_datetime([last_date + pd.Timedelta(weeks=i) for i in range(1, weeks + 1)])
+
+    def forecast(self, weeks_to_forecast, region=DEFAULT_REGION):
+        """Return the all-crop forecast for one region for the next weeks_to_forecast weeks."""
+        invalid = check_weeks(weeks_to_forecast)
+        if invalid:
+            raise ValueError(invalid["error"])
+        cached = self.ensure_horizon(weeks_to_forecast)
+        return pd.DataFrame(cached[self._region_index[region], :weeks_to_forecast],
+                            index=self.future_dates(region, weeks_to_forecast), columns=self.crops)
+
+    def series(self, region, crop, weeks, start=0):
+        """Weeks [start, weeks) of one (region, crop) forecast as {ISO date: price}.
+
+        ensure_horizon(weeks) must have run.
+        """
+        prices = self._forecast[self._region_index[region], start:weeks, self.crops.index(crop)]
+        dates = self.future_dates(region, weeks)[start:]
+        return {date.isoformat(): round(float(price), 2) for date, price in zip(dates, prices)}
+
+    def series_results(self, requests):
+        """One result per request (objects with region, crop and weeks), tagged with its index.
+
+        Rolls out the longest requested horizon first; invalid requests get an "error".
+        """
+        self.ensure_horizon(longest_valid_weeks(requests))
+        for index, request in enumerate(requests):
+            invalid = check_weeks(request.weeks)
+            if request.region not in self.regions:
+                yield {"index": index, "error": f"Region '{request.region}' not found."}
+            elif request.crop not in self.crops:
+                yield {"index": index, "error": f"Crop '{request.crop}' not found in historical data."}
+            elif invalid:
+                yield {"index": index, **invalid}
+            else:
+                yield {"index": index, "region": request.region, "crop": request.crop,
+                       "forecast": self.series(request.region, request.crop, request.weeks)}
+
+    @property
+    def cached_weeks(self):
+        return self._forecast.shape[1] if self._forecast is not None else 0
+
+
+class MarketForecastService:
+    """Keeps the market LSTM and every region's price store open.
+
+    Each subdirectory of store_root holding a price store is one region.
+    Regions listed in sources ({region: csv}) are ingested on first load, and
+    again when the CSV changes. Artifacts are only reloaded when the model, a
+    source CSV or a store changes on disk (an append rewrites that store's
+    meta.json; a new region adds one).
+    Requests always read a complete snapshot, so a reload never exposes a
+    new model paired with an old scaler.
+    """
+
+    def __init__(self, model_path, store_root, sources=None, default_region=DEFAULT_REGION, check_interval=2.0):
+        self.model_path = model_path
+        self.store_root = store_root
+        self.sources = dict(sources or {})
+        self.default_region = default_region
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._file_stamp = None
+        self._last_check = 0.0
+        self._last_error = None
+        self._skipped_regions = {}
+        self._reload_count = 0
+        self._lock = threading.Lock()
+
+    def _region_names(self):
+        if not os.path.isdir(self.store_root):
+            return []
+        return sorted(
+            entry.name for entry in os.scandir(self.store_root)
+            if entry.is_dir() and os.path.exists(os.path.join(entry.path, META_FILE))
+        )
+
+    def _stamp(self):
+        stamp = []
+        paths = ([self.model_path] + list(self.sources.values())
+                 + [os.path.join(self.store_root, name, META_FILE) for name in self._region_names()])
+        for path in paths:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    def _open_regions(self):
+        warnings = []
+        for region, csv_path in self.sources.items():
+            # Ingests the CSV on first run and re-ingests it when it changes
+            store = open_store(os.path.join(self.store_root, region), csv_path)
+            if source_state(store, csv_path) == "diverged":
+                warnings.append(f"{csv_path} changed but region '{region}' has weeks appended since it was "
+                                f"ingested; not re-ingested. Rebuild it with pricestore.py ingest.")
+        # Stamp before opening: an append in between only causes one extra reload
+        stamp = self._stamp()
+        regions, skipped = {}, {}
+        names = self._region_names()
+        if self.default_region in names:
+            names.insert(0, names.pop(names.index(self.default_region)))
+        for name in names:
+            store = PriceStore(os.path.join(self.store_root, name))
+            if regions and store.columns != next(iter(regions.values())).columns:
+                skipped[name] = "crop columns differ from the other regions"
+            elif len(store) < N_STEPS:
+                skipped[name] = f"fewer than {N_STEPS} weeks of history"
+            else:
+                regions[name] = store
+        if self.default_region not in regions:
+            raise FileNotFoundError(f"No usable price store for region '{self.default_region}' in {self.store_root}")
+        return stamp, regions, skipped, warnings
+
+    def load(self):
+        """Load (or reload) every artifact and swap in the new snapshot."""
+        with self._lock:
+            try:
+                with span("open_store"):
+                    stamp, regions, skipped, warnings = self._open_regions()
+                with span("model_load"):
+                    if self.model_path.endswith(".tflite"):
+                        model = LiteModel(self.model_path)
+                    else:
+                        from tensorflow.keras.models import load_model  # type: ignore
+                        model = load_model(self.model_path)
+            except Exception as e:
+                # Keep serving the previous snapshot if the new files are broken
+                self._last_error = str(e)
+                raise
+            version = hashlib.sha1(repr(stamp).encode()).hexdigest()[:12]
+            snapshot = MarketSnapshot(model, regions, version)
+            # Trace the rollout and fill the forecast cache before serving traffic
+            snapshot.ensure_horizon(FORECAST_HORIZON)
+            self._snapshot = snapshot
+            self._file_stamp = stamp
+            self._skipped_regions = skipped
+            self._last_check = time.monotonic()
+            self._last_error = " ".join(warnings) or None
+            self._reload_count += 1
+            return self._snapshot
+
+    def reload_if_changed(self):
+        """Reload when the files on disk differ from the loaded ones."""
+        try:
+            changed = self._stamp() != self._file_stamp
+        except OSError as e:
+            self._last_error = str(e)
+            return False
+        if changed:
+            self.load()
+        return changed
+
+    def get(self):
+        """Return the current snapshot, hot-reloading at most every check_interval seconds."""
+        if self._snapshot is None:
+            return self.load()
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                self.reload_if_changed()
+            except Exception:
+                pass  # Error is recorded in status(); keep the old snapshot
+        return self._snapshot
+
+    def status(self):
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "version": snapshot.version if snapshot else None,
+            "loaded_at": snapshot.loaded_at.isoformat() if snapshot else None,
+            "default_region": self.default_region,
+            "regions": {
+                name: {"history_rows": len(store), "last_date": str(store.last_date.date())}
+                for name, store in snapshot.regions.items()
+            } if snapshot else {},
+            "skipped_regions": self._skipped_regions,
+            "crops": snapshot.crops if snapshot else [],
+            "cached_forecast_weeks": snapshot.cached_weeks if snapshot else 0,
+            "reload_count": self._reload_count,
+            "last_error": self._last_error,
+        }
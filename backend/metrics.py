@@ -0,0 +1,309 @@
+"""Prometheus-style metrics, per-stage spans and a sampling profiler.
+
+    with span("preprocess"):
+        ...
+
+records the stage duration under the endpoint currently being served.
+GET /metrics renders every metric in the Prometheus text format.
+"""
+import contextvars
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _Counter
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_scope = contextvars.ContextVar("cropix_request_scope", default=None)
+# Scopes of the requests being served, by id(scope); in-flight counts are taken at scrape time
+_active_scopes = {}
+
+
+def _endpoint_label(scope):
+    # Route templates only: raw paths (/jobs/<uuid>, 404s) would add a series per request
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def current_endpoint():
+    """Route template of the request being handled (e.g. /models/{name}/reload), or 'background'."""
+    scope = _current_scope.get()
+    if scope is None:
+        return "background"
+    return _endpoint_label(scope)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def replace(self, values):
+        """Set the gauge to values ({label tuple: value}); label sets not in values drop to 0."""
+        with self._lock:
+            self._values = {**dict.fromkeys(self._values, 0), **values}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = [
+            f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', repr(bound))])} {n}"
+            for bound, n in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() is called at scrape time to refresh gauges from other components."""
+        self._collectors.append(collect)
+
+    def render(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception:
+                pass  # A broken collector must not break the whole scrape
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_SECONDS = REGISTRY.histogram(
+    "cropix_request_seconds", "End-to-end request latency", ["endpoint", "method", "status"])
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("cropix_requests_in_flight", "Requests currently being served", ["endpoint"])
+REQUEST_ERRORS = REGISTRY.counter(
+    "cropix_request_errors_total", "Requests that raised or returned a 5xx status", ["endpoint"])
+STAGE_SECONDS = REGISTRY.histogram(
+    "cropix_stage_seconds", "Time spent in one stage of a request", ["endpoint", "stage"])
+STAGE_ERRORS = REGISTRY.counter("cropix_stage_errors_total", "Stages that raised", ["endpoint", "stage"])
+MODEL_INFERENCE_SECONDS = REGISTRY.histogram(
+    "cropix_model_inference_seconds", "Duration of one model call (single row or batch)", ["model"])
+MODEL_LOAD_SECONDS = REGISTRY.gauge("cropix_model_load_seconds", "Duration of the last model load", ["model"])
+BATCH_SIZE = REGISTRY.histogram(
+    "cropix_batch_size", "Items per micro-batched model call", ["model"], buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+def _collect_in_flight():
+    # The route is only known once routing has run, so count by it at scrape time
+    counts = _Counter((_endpoint_label(scope),) for scope in list(_active_scopes.values()))
+    REQUESTS_IN_FLIGHT.replace(counts)
+
+
+REGISTRY.add_collector(_collect_in_flight)
+
+
+@contextmanager
+def span(stage):
+    """Time one stage of the current request (decode, preprocess, inference, ...)."""
+    endpoint = current_endpoint()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(endpoint=endpoint, stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, stage=stage)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and errors per endpoint.
+
+    It wraps the raw ASGI app (no response buffering), so streaming responses
+    are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_scope.set(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        _active_scopes[id(scope)] = scope
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            # A 5xx (or no response at all, status 500) is counted below; count the
+            # error here only when a successful status went out first, e.g. a broken stream
+            if status["code"] < 500:
+                REQUEST_ERRORS.inc(endpoint=current_endpoint())
+            raise
+        finally:
+            endpoint = current_endpoint()
+            _active_scopes.pop(id(scope), None)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                    method=scope["method"], status=status["code"])
+            if status["code"] >= 500:
+                REQUEST_ERRORS.inc(endpoint=endpoint)
+            _current_scope.reset(token)
+
+
+class SamplingProfiler:
+    """Low-overhead statistical profiler that can be started and stopped at runtime.
+
+    A background thread snapshots every thread's stack each interval and counts
+    collapsed stacks ("frame;frame;frame N"), the input format of flamegraph tools.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = _Counter()
+        self._samples = 0
+        self.interval = 0.005
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=5.0):
+        if self.running:
+            return
+        self.interval = interval_ms / 1000
+        self._stacks.clear()
+        self._samples = 0
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = ";".join(
+                    f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                    for entry in traceback.extract_stack(frame)
+                )
+                self._stacks[stack] += 1
+            self._samples += 1
+
+    def report(self, top=50):
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": self._samples,
+            "stacks": [{"stack": stack, "count": count} for stack, count in self._stacks.most_common(top)],
+        }
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in list(self._stacks.items())) + "\n"
+
+
+PROFILER = SamplingProfiler()
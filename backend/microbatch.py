@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference import Overloaded
+from metrics import BATCH_SIZE, MODEL_INFERENCE_SECONDS
+
+LATENCY_WINDOW = 2048  # Number of recent requests kept for percentile metrics
+
+
+class MicroBatcher:
+    """Collects concurrent single-item requests into one batched model call.
+
+    Items queue up until max_batch_size is reached or max_wait_ms has passed
+    since the first item of the batch arrived. The batch is then stacked and
+    run on a dedicated worker thread so the event loop stays free, and each
+    row of the result is handed back to the request that submitted it.
+    Batches are stacked into one reused buffer, so predict_fn must not
+    return views of its input.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10.0, max_queue=128, name="microbatch"):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._buffer = None  # Reused input batch; safe because batches run one at a time
+        self._queue = None
+        self._arrived = None
+        self._worker = None
+        self._in_flight = 0
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._rejected = 0
+        self._batch_sizes = Counter()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._arrived = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        """Queue one input (without batch dimension) and wait for its output row."""
+        self._ensure_started()
+        if self._queue.qsize() >= self.max_queue:
+            self._rejected += 1
+            # Roughly one batch interval per queued batch ahead of us
+            batches_ahead = self._queue.qsize() / self.max_batch_size
+            raise Overloaded(self.name, max(1, round(batches_ahead * self._mean_batch_seconds())))
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        self._arrived.set()
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Waiting on an event (not queue.get) means a timeout can never drop an item
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self._in_flight = len(batch)
+            started = time.perf_counter()
+            try:
+                inputs = self._stack([item for item, _, _ in batch])
+                outputs = await loop.run_in_executor(self._executor, self.predict_fn, inputs)
+                MODEL_INFERENCE_SECONDS.observe(time.perf_counter() - started, model=self.name)
+                BATCH_SIZE.observe(len(batch), model=self.name)
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._in_flight = 0
+
+            finished = time.perf_counter()
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                for _, _, submitted in batch:
+                    self._latencies.append(finished - submitted)
+            for (_, future, _), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+    def _stack(self, items):
+        """Stack items into the reused batch buffer, (re)allocating it for a new item shape or dtype."""
+        first = np.asarray(items[0])
+        buffer = self._buffer
+        if buffer is None or buffer.shape[1:] != first.shape or buffer.dtype != first.dtype:
+            buffer = self._buffer = np.empty((self.max_batch_size,) + first.shape, dtype=first.dtype)
+        return np.stack(items, out=buffer[:len(items)])
+
+    def _mean_batch_seconds(self):
+        with self._lock:
+            if not self._latencies:
+                return 1.0
+            return float(np.mean(self._latencies))
+
+    def metrics(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            batches, items, errors = self._batches, self._items, self._errors
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": queued + self._in_flight,
+            "batches": batches,
+            "items": items,
+            "errors": errors,
+            "rejected": self._rejected,
+            "mean_batch_size": round(items / batches, 2) if batches else 0.0,
+            "batch_size_histogram": batch_sizes,
+            "latency_ms": {
+                "p50": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+                "p99": round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+            },
+        }
@@ -0,0 +1,233 @@
+"""Columnar, memory-mapped store for weekly crop price history.
+
+A store is a directory holding two flat binary columns and a small header:
+
+    dates.i8     int64 days since 1970-01-01, one per row
+    prices.f4    float32 prices, row-major (rows, n_crops)
+    meta.json    columns, row count and running per-crop min/max
+
+The CSV is ingested once (again whenever it changes, unless weeks were appended
+to the store since); readers memory-map only the first meta["rows"]
+rows, so tail(n) touches a few pages instead of parsing the whole history.
+New weeks are appended to the end of both files and meta.json is replaced
+last, atomically, so readers never see a half-written append. The running
+min/max means the MinMaxScaler is rebuilt without scanning the history.
+There must be a single writer per store.
+
+    python pricestore.py ingest Datasets/central_india_weekly_crop_prices.csv Datasets/price_store/central_india
+    python pricestore.py append Datasets/price_store/central_india new_weeks.csv
+    python pricestore.py info Datasets/price_store/central_india
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+from locks import lock_file
+
+META_FILE = "meta.json"
+DATES_FILE = "dates.i8"
+PRICES_FILE = "prices.f4"
+INGEST_CHUNK_ROWS = 100_000
+
+
+def read_price_csv(path, **kwargs):
+    return pd.read_csv(path, index_col='Date', parse_dates=True, **kwargs)
+
+
+class PriceStore:
+    """Read view of a store as of its meta.json when opened; call append() to grow it."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.columns = list(self.meta["columns"])
+        rows, width = self.meta["rows"], len(self.columns)
+        if rows:
+            self.dates = np.memmap(os.path.join(path, DATES_FILE), dtype="<i8", mode="r", shape=(rows,))
+            self.values = np.memmap(os.path.join(path, PRICES_FILE), dtype="<f4", mode="r", shape=(rows, width))
+        else:
+            self.dates = np.empty(0, dtype="<i8")
+            self.values = np.empty((0, width), dtype="<f4")
+
+    @classmethod
+    def create(cls, path, columns):
+        os.makedirs(path)
+        open(os.path.join(path, DATES_FILE), "wb").close()
+        open(os.path.join(path, PRICES_FILE), "wb").close()
+        _write_meta(path, {"columns": list(columns), "rows": 0, "min": None, "max": None})
+        return cls(path)
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.path, META_FILE)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(int(self.dates[-1]), unit="D") if len(self) else None
+
+    def index(self, start=0, stop=None):
+        return pd.DatetimeIndex(np.asarray(self.dates[start:stop]).astype("datetime64[D]"), name="Date")
+
+    def tail(self, n):
+        """Last n rows as a float64 (n, n_crops) array; only those pages are read."""
+        return np.array(self.values[-n:], dtype=np.float64)
+
+    def frame(self, start=0, stop=None):
+        """Materialize rows [start, stop) as a DataFrame indexed by date."""
+        return pd.DataFrame(np.asarray(self.values[start:stop], dtype=np.float64),
+                            index=self.index(start, stop), columns=self.columns)
+
+    def scaler(self, feature_range=(0, 1)):
+        """MinMaxScaler equal to one fitted on the full history, built from the stored min/max."""
+        bounds = np.array([self.meta["min"], self.meta["max"]], dtype=np.float64)
+        return MinMaxScaler(feature_range=feature_range).fit(bounds)
+
+    def append(self, frame):
+        """Append rows (a DataFrame indexed by date, same columns) after the last stored week."""
+        if list(frame.columns) != self.columns:
+            raise ValueError(f"Columns {list(frame.columns)} do not match the store's {self.columns}.")
+        if frame.empty:
+            return self
+        days = frame.index.values.astype("datetime64[D]").astype("<i8")
+        if np.any(np.diff(days) <= 0) or (len(self) and days[0] <= self.dates[-1]):
+            raise ValueError("Appended dates must be increasing and after the last stored date.")
+        values = frame.to_numpy(dtype="<f4")
+        if np.isnan(values).any():
+            raise ValueError("Appended prices contain missing values.")
+
+        rows = len(self)
+        width = len(self.columns)
+        for name, data, row_bytes in ((DATES_FILE, days, 8), (PRICES_FILE, values, 4 * width)):
+            with open(os.path.join(self.path, name), "r+b") as f:
+                # Drop any tail left by an append that crashed before updating meta.json
+                f.truncate(rows * row_bytes)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(data).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        col_min, col_max = values.min(axis=0), values.max(axis=0)
+        if rows:
+            col_min = np.minimum(col_min, self.meta["min"])
+            col_max = np.maximum(col_max, self.meta["max"])
+        _write_meta(self.path, {**self.meta, "rows": rows + len(values),
+                                "min": col_min.tolist(), "max": col_max.tolist()})
+        self.__init__(self.path)
+        return self
+
+
+def _write_meta(path, meta):
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def ingest_csv(csv_path, path, chunk_rows=INGEST_CHUNK_ROWS, replace=False):
+    """Build a new store from a price CSV, reading it in chunks. Returns the opened store.
+
+    With replace, an existing store at path is swapped out for the new one.
+    """
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    # Stamped before reading, so an edit made during the ingest is picked up next time
+    source = _source_stamp(csv_path)
+    store = None
+    for chunk in read_price_csv(csv_path, chunksize=chunk_rows):
+        if store is None:
+            store = PriceStore.create(tmp, chunk.columns)
+        store.append(chunk)
+    if store is None:
+        raise ValueError(f"{csv_path} has no rows.")
+    _write_meta(tmp, {**store.meta, "source": {**source, "rows": len(store)}})
+    if replace and os.path.exists(path):
+        old = f"{path}.old-{os.getpid()}"
+        os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)  # Open memory maps of the old files stay valid
+        return PriceStore(path)
+    try:
+        # Atomic publish; if another worker got there first, keep its copy
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            raise
+    return PriceStore(path)
+
+
+def source_state(store, csv_path):
+    """How store relates to the CSV it was ingested from: "current", "changed" (safe to
+    re-ingest) or "diverged" (changed, but the store has weeks appended since, or predates
+    source tracking, so re-ingesting could drop data)."""
+    source = store.meta.get("source")
+    if source is None:
+        newer = os.stat(csv_path).st_mtime_ns > os.stat(store.meta_path).st_mtime_ns
+        return "diverged" if newer else "current"
+    if {key: source[key] for key in ("mtime_ns", "size")} == _source_stamp(csv_path):
+        return "current"
+    return "changed" if len(store) == source["rows"] else "diverged"
+
+
+def open_store(path, csv_path=None):
+    """Open the store at path, ingesting csv_path first if it does not exist yet or has changed
+    since the store was built from it (see source_state)."""
+    if csv_path is None:
+        return PriceStore(path)
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return ingest_csv(csv_path, path)
+    store = PriceStore(path)
+    if source_state(store, csv_path) != "changed":
+        return store
+    # Several workers may notice the change at once; only one rebuilds
+    with open(f"{path}.lock", "w") as lock:
+        lock_file(lock)
+        store = PriceStore(path)
+        if source_state(store, csv_path) == "changed":
+            store = ingest_csv(csv_path, path, replace=True)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage a memory-mapped crop price store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Create a store from a price CSV")
+    ingest.add_argument("csv")
+    ingest.add_argument("store")
+    append = commands.add_parser("append", help="Append new weeks from a CSV with the same columns")
+    append.add_argument("store")
+    append.add_argument("csv")
+    info = commands.add_parser("info", help="Show the size and date range of a store")
+    info.add_argument("store")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        store = ingest_csv(args.csv, args.store)
+    elif args.command == "append":
+        store = PriceStore(args.store).append(read_price_csv(args.csv))
+    else:
+        store = PriceStore(args.store)
+    first = store.index(0, 1)[0].date() if len(store) else None
+    print(f"{store.path}: {len(store)} weeks x {len(store.columns)} crops, {first} .. "
+          f"{store.last_date.date() if len(store) else None}")
+
+
+if __name__ == "__main__":
+    main()
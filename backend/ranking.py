@@ -0,0 +1,36 @@
+import numpy as np
+
+MAX_TOP_K = 20
+
+
+def top_k(scores, k):
+    """Indices and scores of the k best classes per row, best first, for an (n, classes) array.
+
+    Selection is a partial sort (np.partition finds each row's k-th best score
+    in linear time), then only the k winners are ordered. Ties go to the lower
+    class index, as with argmax, so column 0 always matches argmax.
+    """
+    scores = np.asarray(scores)
+    n, n_classes = scores.shape
+    k = max(1, min(k, n_classes))
+    if k == n_classes:
+        selected = np.ones_like(scores, dtype=bool)
+    else:
+        kth = np.partition(scores, n_classes - k, axis=1)[:, n_classes - k, np.newaxis]
+        above = scores > kth
+        # Fill the remaining slots with the lowest-index classes tied at the k-th score
+        tied = scores == kth
+        needed = k - above.sum(axis=1, keepdims=True)
+        selected = above | (tied & (np.cumsum(tied, axis=1) <= needed))
+    indices = np.nonzero(selected)[1].reshape(n, k)
+    values = np.take_along_axis(scores, indices, axis=1)
+    order = np.lexsort((indices, -values), axis=1)
+    indices = np.take_along_axis(indices, order, axis=1)
+    return indices, np.take_along_axis(values, order, axis=1)
+
+
+def check_top_k(k):
+    """Return an error dict for an out-of-range top_k, else None."""
+    if k is not None and not 1 <= k <= MAX_TOP_K:
+        return {"error": f"top_k must be between 1 and {MAX_TOP_K}."}
+    return None
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import MODEL_LOAD_SECONDS, span
+
+# "eager": start loading every model in parallel threads at startup
+# "lazy": load each model the first time a request needs it
+MODEL_LOADING = os.getenv("MODEL_LOADING", "eager").lower()
+
+
+class ModelSpec:
+    def __init__(self, name, loader, endpoints, paths):
+        self.name = name
+        self.loader = loader
+        self.endpoints = list(endpoints)
+        self.paths = list(paths)
+        self.version = None
+        self.lock = threading.Lock()
+        self.value = None
+        self.loaded = False
+        self.error = None
+        self.load_seconds = None
+
+
+class ModelRegistry:
+    """Loads each model artifact at most once, lazily or in parallel at startup.
+
+    Loaders are plain callables, so heavy imports (TensorFlow) can live inside
+    them and are only paid for when a model that needs them is loaded.
+    """
+
+    def __init__(self):
+        self._specs = {}
+        self._reload_listeners = []
+
+    def register(self, name, loader, endpoints=(), paths=()):
+        self._specs[name] = ModelSpec(name, loader, endpoints, paths)
+
+    def on_reload(self, callback):
+        """Call callback(name) after a model has been reloaded."""
+        self._reload_listeners.append(callback)
+
+    @staticmethod
+    def _file_version(paths):
+        stamp = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stamp.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamp.append((path, None, None))
+        return hashlib.sha1(repr(stamp).encode()).hexdigest()[:12]
+
+    def _load(self, spec):
+        start = time.perf_counter()
+        version = self._file_version(spec.paths)
+        try:
+            with span("model_load"):
+                spec.value = spec.loader()
+        except Exception as e:
+            spec.error = str(e)
+            raise
+        spec.load_seconds = time.perf_counter() - start
+        MODEL_LOAD_SECONDS.set(spec.load_seconds, model=spec.name)
+        spec.version = version
+        spec.error = None
+        spec.loaded = True
+
+    def get(self, name):
+        """Return the loaded model, loading it on first use (thread-safe)."""
+        spec = self._specs[name]
+        if spec.loaded:
+            return spec.value
+        with spec.lock:
+            if not spec.loaded:
+                self._load(spec)
+        return spec.value
+
+    def reload(self, name):
+        """Load a fresh copy of the model; the old one keeps serving until the swap."""
+        spec = self._specs[name]
+        with spec.lock:
+            self._load(spec)
+        for callback in self._reload_listeners:
+            callback(name)
+        return spec.value
+
+    def version(self, name):
+        """Version of the loaded artifact files, or None if the model is not loaded yet."""
+        return self._specs[name].version
+
+    def is_ready(self, name):
+        return self._specs[name].loaded
+
+    def _try_get(self, name):
+        try:
+            self.get(name)
+        except Exception:
+            pass  # Recorded on the spec and reported by status()
+
+    def warm(self, names=None, wait=False):
+        """Load the given (default: all) models in parallel background threads."""
+        names = list(names or self._specs)
+        # A fresh pool per call: its threads exit when done, so nothing stale survives a fork
+        executor = ThreadPoolExecutor(max_workers=max(1, len(names)), thread_name_prefix="model-load")
+        futures = [executor.submit(self._try_get, name) for name in names]
+        executor.shutdown(wait=wait)
+        return futures
+
+    def status(self):
+        return {
+            name: {
+                "ready": spec.loaded,
+                "load_seconds": round(spec.load_seconds, 3) if spec.load_seconds is not None else None,
+                "error": spec.error,
+                "version": spec.version,
+                **(spec.value.status() if spec.loaded and hasattr(spec.value, "status") else {}),
+                "endpoints": spec.endpoints,
+            }
+            for name, spec in self._specs.items()
+        }
+
+    def endpoint_status(self):
+        """Map each endpoint to True once every model it depends on is loaded."""
+        endpoints = {}
+        for spec in self._specs.values():
+            for endpoint in spec.endpoints:
+                endpoints[endpoint] = endpoints.get(endpoint, True) and spec.loaded
+        return endpoints
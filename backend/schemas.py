@@ -0,0 +1,100 @@
+"""Input schemas and result formatting shared by the API (main.py) and the cropix CLI."""
+from typing import List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from market import DEFAULT_REGION
+from ranking import top_k as top_k_classes
+
+
+class CropYieldInput(BaseModel):
+    Crop: str
+    Season: str
+    Area: float
+    Fertilizer: float
+    Crop_Year: int
+    Pesticide: float
+    Annual_Rainfall: float
+
+
+class ScenarioAxis(BaseModel):
+    """One swept input: explicit values, or num evenly spaced values from start to stop (inclusive)."""
+    field: str
+    values: Optional[List[float]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    num: Optional[int] = None
+
+    def size(self):
+        return len(self.values) if self.values is not None else max(self.num or 0, 0)
+
+    def grid_values(self):
+        if self.values is not None:
+            return np.asarray(self.values, dtype=np.float64)
+        if None in (self.start, self.stop, self.num) or self.num < 1:
+            raise ValueError(f"Axis '{self.field}' needs either values or start, stop and num >= 1.")
+        return np.linspace(self.start, self.stop, self.num)
+
+
+class CropYieldScenarioInput(BaseModel):
+    base: CropYieldInput
+    axes: List[ScenarioAxis]
+
+
+class SoilCropRecommendationInput(BaseModel):
+    N: float
+    P: float
+    K: float
+    temperature: float
+    humidity: float
+    ph: float
+    rainfall: float
+
+
+class FertilizerRecommendationInput(BaseModel):
+    Crop: str
+    Current_N: float
+    Current_P: float
+    Current_K: float
+
+
+class MarketSeriesRequest(BaseModel):
+    crop: str
+    weeks: int
+    region: str = DEFAULT_REGION
+
+
+def crop_yield_results(model, records):
+    return [{"predicted_yield": value} for value in model.predict_records(records).tolist()]
+
+
+def soil_crop_results(model, records, top_k=None):
+    if top_k is None:
+        return [{"recommended_crop": str(label)} for label in model.predict_records(records)]
+    # Vote shares and nearest distances come from the same neighbour query as the label
+    return [
+        {"recommended_crop": ranked[0]["label"],
+         "top_k": [{"crop": entry.pop("label"), **entry} for entry in ranked]}
+        for ranked in model.rank_records(records, top_k)
+    ]
+
+
+def fertilizer_results(model, records):
+    return [
+        {"recommended_N": n, "recommended_P": p, "recommended_K": k}
+        for n, p, k in model.predict_records(records).tolist()
+    ]
+
+
+def disease_result(probabilities, classes, top_k=None):
+    """Result for one image's class probabilities."""
+    probabilities = np.asarray(probabilities)
+    best = int(np.argmax(probabilities))
+    result = {"predicted_disease": str(classes[best]), "confidence": float(probabilities[best])}
+    if top_k is not None:
+        # Ranked from the same forward pass; the first entry equals the argmax above
+        indices, scores = top_k_classes(probabilities[np.newaxis], top_k)
+        result["top_k"] = [{"disease": str(classes[index]), "confidence": float(score)}
+                           for index, score in zip(indices[0], scores[0])]
+    return result
@@ -0,0 +1,64 @@
+"""Process and thread settings for running several API workers on one machine.
+
+Each worker gets cpu_count // WEB_CONCURRENCY threads for BLAS/OpenMP
+(XGBoost, scikit-learn) and for TensorFlow's intra-op pool, so N workers
+never run more compute threads than there are cores.
+"""
+import os
+
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+THREADS_PER_WORKER = int(os.getenv("CROPIX_THREADS_PER_WORKER", "0")) or max(1, (os.cpu_count() or 1) // WORKERS)
+# Memory-map numpy arrays inside joblib artifacts so workers share them through the page cache
+MODEL_MMAP = os.getenv("CROPIX_MODEL_MMAP", "1") == "1"
+# Set by gunicorn.conf.py: load the shared (non-TensorFlow) artifacts in the master before fork
+PRELOAD_SHARED_MODELS = os.getenv("CROPIX_PRELOAD", "0") == "1"
+# keras: serve the original .h5/.keras files; tflite: serve the exports written by export_models.py
+MODEL_RUNTIME = os.getenv("CROPIX_MODEL_RUNTIME", "keras").lower()
+TFLITE_VARIANT = os.getenv("CROPIX_TFLITE_VARIANT", "float16").lower()  # float32 | float16 | int8
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+_tensorflow_configured = False
+
+
+def configure_threads():
+    """Cap BLAS/OpenMP threads. Must run before numpy/xgboost are imported."""
+    for name in _THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(THREADS_PER_WORKER))
+
+
+def configure_tensorflow():
+    """Cap TensorFlow's thread pools. Must run before the first TF op executes."""
+    global _tensorflow_configured
+    if _tensorflow_configured:
+        return
+    import tensorflow as tf  # type: ignore
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(THREADS_PER_WORKER)
+        tf.config.threading.set_inter_op_parallelism_threads(min(2, THREADS_PER_WORKER))
+    except RuntimeError:
+        pass  # TF already initialised (e.g. in a REPL); keep its settings
+    _tensorflow_configured = True
+
+
+def configure_worker_processes(workers):
+    """Split the cores between `workers` child processes; call before starting them."""
+    threads = int(os.getenv("CROPIX_THREADS_PER_WORKER", "0")) or max(1, (os.cpu_count() or 1) // workers)
+    os.environ["CROPIX_THREADS_PER_WORKER"] = str(threads)
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    return threads
+
+
+def load_keras_model(path):
+    if path.endswith(".tflite"):
+        from lite import LiteModel
+        return LiteModel(path)
+    # TensorFlow is only imported once a Keras model is actually needed
+    configure_tensorflow()
+    from tensorflow.keras.models import load_model  # type: ignore
+    return load_model(path)
+
+
+def load_joblib(path):
+    import joblib
+    return joblib.load(path, mmap_mode="r" if MODEL_MMAP else None)
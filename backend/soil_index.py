@@ -0,0 +1,246 @@
+"""Nearest-neighbour index for the soil crop recommender.
+
+The soil model is a KNeighborsClassifier over 7 numeric features. At that
+dimensionality a KD-tree query stays close to logarithmic in the training-set
+size, so the index is exact: it returns the same neighbours as the model
+(recall 1.0) and predictions do not change. `python soil_index.py benchmark`
+shows query latency against brute force and the model's own tree as the
+training set grows.
+
+The index is built from the fitted KNN's training data, with the leaf size
+chosen by timing sample queries, and saved next to the model artifact:
+
+    Trained_models/Soil_crop_recom.index.joblib
+
+Its arrays are memory-mapped on load (CROPIX_MODEL_MMAP), so API workers share
+them through the page cache. The file records a fingerprint of the training
+data; an index that does not match the loaded model is rebuilt.
+
+    python soil_index.py build Trained_models/Soil_crop_recom.joblib
+    python soil_index.py info Trained_models/Soil_crop_recom.joblib
+    python soil_index.py benchmark --sizes 1540 20000 200000 1000000
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+import serving
+
+LEAF_SIZES = (8, 16, 30, 64)  # 30 is scikit-learn's default
+TUNING_QUERIES = 1024
+# Metrics a KD-tree can search exactly (the model's default is minkowski with p=2)
+SUPPORTED_METRICS = set(KDTree.valid_metrics)
+
+
+def index_path(model_path):
+    return os.path.splitext(model_path)[0] + ".index.joblib"
+
+
+def fingerprint(knn):
+    """Hash of the KNN's training rows and labels, to detect an index built for another model."""
+    digest = hashlib.sha1()
+    for array in (knn._fit_X, knn._y):
+        array = np.ascontiguousarray(array)
+        digest.update(repr((array.dtype.str, array.shape)).encode())
+        digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
+
+
+def _single_seconds(searcher, queries, k):
+    """Seconds per one-row query."""
+    start = time.perf_counter()
+    for row in queries:
+        searcher.query(row[np.newaxis], k=k)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def _batched_seconds(searcher, queries, k):
+    """Seconds per row of a single batched query."""
+    start = time.perf_counter()
+    searcher.query(queries, k=k)
+    return (time.perf_counter() - start) / len(queries)
+
+
+class NeighborIndex:
+    """KD-tree over a KNN's training rows; query() matches KDTree.query, so it can stand in for knn._tree."""
+
+    def __init__(self, tree, meta):
+        self.tree = tree
+        self.meta = meta
+
+    @classmethod
+    def build(cls, knn, leaf_sizes=LEAF_SIZES, seed=0):
+        """Build from a fitted KNeighborsClassifier, keeping the leaf size with the fastest sample queries."""
+        metric = knn.effective_metric_
+        if metric not in SUPPORTED_METRICS:
+            raise NotImplementedError(f"metric {metric!r} is not supported by a KD-tree")
+        X = np.asarray(knn._fit_X, dtype=np.float64)
+        rng = np.random.default_rng(seed)
+        # Training rows plus noise: unperturbed rows would each find themselves at distance 0
+        queries, _ = _synthetic_training_set(X, knn._y, TUNING_QUERIES, rng)
+        k = min(knn.n_neighbors, len(X))
+
+        start = time.perf_counter()
+        best = None
+        timings = {}
+        for leaf_size in leaf_sizes:
+            tree = KDTree(X, leaf_size=leaf_size, metric=metric, **(knn.effective_metric_params_ or {}))
+            # A one-row query is dominated by fixed per-call overhead, so tune on batched
+            # latency (best of 3 to damp noise); it also tracks the tree-walk cost of single rows
+            seconds = min(_batched_seconds(tree, queries, k) for _ in range(3))
+            timings[leaf_size] = round(seconds * 1e6, 2)
+            if best is None or seconds < best[0]:
+                best = (seconds, leaf_size, tree)
+        meta = {
+            "rows": len(X),
+            "features": X.shape[1],
+            "metric": metric,
+            "leaf_size": best[1],
+            "tuning_us_per_row": timings,
+            "build_seconds": round(time.perf_counter() - start, 3),
+            "fingerprint": fingerprint(knn),
+        }
+        return cls(best[2], meta)
+
+    def save(self, path):
+        import joblib
+        tmp = f"{path}.tmp-{os.getpid()}"
+        joblib.dump({"tree": self.tree, "meta": self.meta}, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        state = serving.load_joblib(path)
+        return cls(state["tree"], state["meta"])
+
+    def matches(self, knn):
+        return self.meta["fingerprint"] == fingerprint(knn)
+
+    def query(self, X, k):
+        """(distances, indices) of the k nearest training rows for each row of X, nearest first."""
+        return self.tree.query(np.asarray(X, dtype=np.float64), k=k)
+
+    def status(self):
+        return {key: self.meta[key] for key in ("rows", "leaf_size", "build_seconds")}
+
+
+def open_index(model_path, knn):
+    """Load the index saved next to model_path, building (and saving) it if missing or stale.
+
+    Returns None when the model cannot use a KD-tree (e.g. an unsupported metric).
+    """
+    path = index_path(model_path)
+    try:
+        index = NeighborIndex.load(path)
+        if index.matches(knn):
+            return index
+    except (OSError, KeyError, ValueError, EOFError):
+        pass
+    try:
+        index = NeighborIndex.build(knn)
+    except NotImplementedError:
+        return None
+    try:
+        index.save(path)
+    except OSError:
+        pass  # Read-only deployment: serve the in-memory index
+    return index
+
+
+# --- Benchmark ---
+
+def _synthetic_training_set(X, y, n, rng):
+    """n rows resampled from the real training set with 5% per-feature jitter."""
+    picks = rng.integers(len(X), size=n)
+    noise = rng.normal(0, 0.05, size=(n, X.shape[1])) * X.std(axis=0)
+    return X[picks] + noise, y[picks]
+
+
+class _KNeighbors:
+    """Adapts a fitted KNN's kneighbors() to the query() interface."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def query(self, X, k):
+        return self.model.kneighbors(X, n_neighbors=k)
+
+
+def benchmark(knn, sizes, batch_rows, single_queries, seed=0):
+    """Per-row query latency of brute force, the model's default tree and the tuned index per training-set size."""
+    from sklearn.neighbors import KNeighborsClassifier
+
+    rng = np.random.default_rng(seed)
+    X = np.asarray(knn._fit_X, dtype=np.float64)
+    y = np.asarray(knn.classes_)[knn._y]
+    k = knn.n_neighbors
+    results = []
+    for n in sizes:
+        train_X, train_y = (X, y) if n == len(X) else _synthetic_training_set(X, y, n, rng)
+        queries, _ = _synthetic_training_set(X, y, batch_rows, rng)
+        searchers = {
+            "brute": _KNeighbors(KNeighborsClassifier(n_neighbors=k, algorithm="brute").fit(train_X, train_y)),
+            # What tabular.py queries without an index: the model's own tree at its default leaf size
+            "default_kd_tree": KNeighborsClassifier(
+                n_neighbors=k, algorithm="kd_tree", leaf_size=knn.leaf_size).fit(train_X, train_y)._tree,
+        }
+        start = time.perf_counter()
+        searchers["index"] = NeighborIndex.build(searchers["brute"].model)
+        build_seconds = time.perf_counter() - start
+
+        row = {"rows": n}
+        _, reference = searchers["brute"].query(queries, k=k)
+        for label, searcher in searchers.items():
+            _, indices = searcher.query(queries, k=k)
+            # Fraction of the exact (brute-force) neighbours found
+            recall = np.mean([len(set(found) & set(exact)) / k for found, exact in zip(indices, reference)])
+            row[label] = {"single_us": round(_single_seconds(searcher, queries[:single_queries], k) * 1e6, 1),
+                          "batched_us": round(_batched_seconds(searcher, queries, k) * 1e6, 1),
+                          "recall": round(float(recall), 4)}
+        row["index"].update(build_seconds=round(build_seconds, 3), leaf_size=searchers["index"].meta["leaf_size"])
+        results.append(row)
+        print(f"{n:>9} rows  " + "  ".join(
+            f"{label} {row[label]['single_us']:8.1f} / {row[label]['batched_us']:7.1f} us" for label in searchers)
+            + f"  (single / batched per row, index recall {row['index']['recall']})")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or benchmark the soil recommender's nearest-neighbour index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("build", "Build the index next to the model artifact"),
+                            ("info", "Show the saved index and whether it matches the model")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("model", nargs="?", default="Trained_models/Soil_crop_recom.joblib")
+    bench = commands.add_parser("benchmark", help="Query latency vs training-set size")
+    bench.add_argument("model", nargs="?", default="Trained_models/Soil_crop_recom.joblib")
+    bench.add_argument("--sizes", type=int, nargs="*", default=[1540, 20_000, 200_000, 1_000_000])
+    bench.add_argument("--batch-rows", type=int, default=2000, help="Rows per batched query")
+    bench.add_argument("--single-queries", type=int, default=500, help="One-row queries timed per size")
+    bench.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    import joblib
+    knn = joblib.load(args.model)
+    if args.command == "build":
+        index = NeighborIndex.build(knn)
+        index.save(index_path(args.model))
+        print(f"wrote {index_path(args.model)}: {json.dumps(index.meta, indent=2)}")
+    elif args.command == "info":
+        index = NeighborIndex.load(index_path(args.model))
+        print(json.dumps({**index.meta, "matches_model": index.matches(knn)}, indent=2))
+    else:
+        results = benchmark(knn, args.sizes, args.batch_rows, args.single_queries)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"n_neighbors": knn.n_neighbors, "sizes": results}, f, indent=2)
+            print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""Precompiled feature encoding for the tabular (scikit-learn/XGBoost) models.
+
+A TabularModel turns validated input dicts straight into a NumPy array in the
+estimator's column order, without building a pandas DataFrame or dispatching
+through the ColumnTransformer, and then calls the underlying estimator:
+
+- Pipeline(ColumnTransformer(OneHotEncoder + passthrough), estimator):
+  categories become index lookups into a preallocated float32 array. When the
+  fitted ColumnTransformer emits sparse output, XGBoost sees absent (zero)
+  entries as missing, so zeros are encoded as NaN to keep predictions identical.
+- XGBoost regressors are called through Booster.inplace_predict.
+- A bare KNeighborsClassifier is queried on a NeighborIndex (soil_index.py)
+  when one is given, else on its own KD-tree/ball-tree (float64, matching the
+  fitted tree), and the neighbour labels are voted.
+
+Anything else falls back to the original DataFrame + model.predict path.
+Run `python tabular.py` to check the fast path against the pipelines.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from ranking import top_k
+
+TABULAR_FAST_PATH = os.getenv("TABULAR_FAST_PATH", "1") == "1"
+
+
+def _is_passthrough(transformer):
+    if isinstance(transformer, str):
+        return transformer == "passthrough"
+    # scikit-learn >= 1.5 stores a fitted remainder='passthrough' as an identity FunctionTransformer
+    return (type(transformer).__name__ == "FunctionTransformer"
+            and transformer.func is None and transformer.inverse_func is None)
+
+
+class _OneHotBlock:
+    def __init__(self, encoder, columns, start):
+        if encoder.drop_idx_ is not None or getattr(encoder, "_infrequent_enabled", False):
+            raise NotImplementedError("OneHotEncoder with drop/infrequent categories")
+        self.columns = list(columns)
+        self.ignore_unknown = encoder.handle_unknown != "error"
+        self.lookups = []
+        offset = start
+        for categories in encoder.categories_:
+            self.lookups.append({category: offset + j for j, category in enumerate(categories.tolist())})
+            offset += len(categories)
+
+    def fill(self, X, records):
+        for column, lookup in zip(self.columns, self.lookups):
+            for i, record in enumerate(records):
+                index = lookup.get(record[column])
+                if index is not None:
+                    X[i, index] = 1.0
+                elif not self.ignore_unknown:
+                    raise ValueError(f"Found unknown category {record[column]!r} in column {column!r}")
+
+
+class _PassthroughBlock:
+    def __init__(self, columns, start):
+        self.columns = list(columns)
+        self.start = start
+
+    def fill(self, X, records):
+        for offset, column in enumerate(self.columns):
+            X[:, self.start + offset] = [record[column] for record in records]
+
+
+class TabularModel:
+    """Wraps a fitted tabular model with a compiled encoder when the model allows it."""
+
+    def __init__(self, model, fast_path=TABULAR_FAST_PATH, index=None):
+        self.model = model
+        self.index = index
+        self.columns = [str(c) for c in getattr(model, "feature_names_in_", [])]
+        self.fast = False
+        self.fallback_reason = None
+        if not fast_path:
+            self.fallback_reason = "disabled"
+            return
+        try:
+            self._compile()
+            self.fast = True
+        except NotImplementedError as e:
+            self.fallback_reason = str(e)
+
+    def _compile(self):
+        model = self.model
+        steps = getattr(model, "steps", None)
+        if steps is None:
+            if type(model).__name__ == "KNeighborsClassifier" and (
+                    self.index is not None or getattr(model, "_tree", None) is not None):
+                self._estimator_kind = "knn_tree"
+                self._n_features = model.n_features_in_
+                self._blocks = [_PassthroughBlock(self.columns, 0)]
+                self._dtype = np.float64
+                self._zeros_missing = False
+                return
+            raise NotImplementedError(f"unsupported model {type(model).__name__}")
+
+        if len(steps) != 2 or type(steps[0][1]).__name__ != "ColumnTransformer":
+            raise NotImplementedError("pipeline is not ColumnTransformer + estimator")
+        transformer, estimator = steps[0][1], steps[1][1]
+        blocks = []
+        for name, trans, columns in transformer.transformers_:
+            if trans == "drop":
+                continue
+            start = transformer.output_indices_[name].start
+            if type(trans).__name__ == "OneHotEncoder":
+                blocks.append(_OneHotBlock(trans, columns, start))
+            elif _is_passthrough(trans):
+                blocks.append(_PassthroughBlock(columns, start))
+            else:
+                raise NotImplementedError(f"unsupported transformer {type(trans).__name__}")
+
+        self._blocks = blocks
+        self._n_features = max(s.stop for s in transformer.output_indices_.values())
+        self._dtype = np.float32
+        self._estimator = estimator
+        if hasattr(estimator, "get_booster"):
+            self._estimator_kind = "xgboost"
+            self._booster = estimator.get_booster()
+            self._thresholds = None
+            try:
+                self._iteration_range = (0, estimator.best_iteration + 1)
+            except AttributeError:
+                self._iteration_range = (0, 0)
+            # Sparse ColumnTransformer output: XGBoost treats absent entries as missing
+            self._zeros_missing = bool(transformer.sparse_output_)
+        else:
+            self._estimator_kind = "sklearn"
+            self._zeros_missing = False
+
+    def encode(self, records):
+        """Encode a list of input dicts into the estimator's feature matrix."""
+        X = np.zeros((len(records), self._n_features), dtype=self._dtype)
+        for block in self._blocks:
+            block.fill(X, records)
+        if self._zeros_missing:
+            X[X == 0] = np.nan
+        return X
+
+    def predict_records(self, records):
+        """Predict a list of input dicts (keys = model input columns)."""
+        if not self.fast:
+            return self.model.predict(pd.DataFrame(records, columns=self.columns or None))
+        return self._predict_encoded(self.encode(records))
+
+    def predict_grid(self, record, grid):
+        """Predict record with numeric columns replaced by every combination of grid values.
+
+        grid maps column -> 1-D values. Row i of the result is grid point
+        np.unravel_index(i, shape) in the order of grid's columns (the last
+        varies fastest). The record is encoded once and the swept columns are
+        written into a repeated copy, so the whole grid is one predict call.
+        """
+        grid = {column: np.asarray(values, dtype=np.float64) for column, values in grid.items()}
+        thresholds = self._split_thresholds() if self.fast and self._estimator_kind == "xgboost" else None
+        if thresholds is not None:
+            # Values between the same two split thresholds of a feature take the same branch in
+            # every tree, so one value per interval is scored and the surface broadcast back
+            reduced, inverses = {}, []
+            for column, values in grid.items():
+                index = self._feature_index(column)
+                values32 = values.astype(np.float32)
+                interval = np.searchsorted(thresholds.get(index, np.empty(0, np.float32)), values32, side="right")
+                if self._zeros_missing:
+                    interval[values32 == 0] = -1  # Encoded as missing, which has its own default branch
+                _, first, inverse = np.unique(interval, return_index=True, return_inverse=True)
+                reduced[column] = values[first]
+                inverses.append(inverse.ravel())
+            if sum(len(values) for values in reduced.values()) < sum(len(values) for values in grid.values()):
+                shape = [len(values) for values in reduced.values()]
+                predictions = self._predict_grid_rows(record, reduced).reshape(shape)
+                return predictions[np.ix_(*inverses)].ravel()
+        return self._predict_grid_rows(record, grid)
+
+    def _split_thresholds(self):
+        """Sorted float32 split thresholds per feature index, read once from the booster (gbtree only)."""
+        if self._thresholds is None:
+            booster = json.loads(self._booster.save_raw("json"))["learner"]["gradient_booster"]
+            if booster.get("name") != "gbtree":
+                return None
+            model = booster["model"]
+            features, conditions = [], []
+            for tree in model["trees"]:
+                internal = np.asarray(tree["left_children"]) != -1
+                features.append(np.asarray(tree["split_indices"])[internal])
+                conditions.append(np.asarray(tree["split_conditions"], dtype=np.float32)[internal])
+            features, conditions = np.concatenate(features), np.concatenate(conditions)
+            self._thresholds = {int(feature): np.unique(conditions[features == feature])
+                                for feature in np.unique(features)}
+        return self._thresholds
+
+    def _predict_grid_rows(self, record, grid):
+        mesh = np.meshgrid(*grid.values(), indexing="ij")
+        n = mesh[0].size if mesh else 1
+        if not self.fast:
+            frame = pd.DataFrame({column: [record[column]] * n for column in self.columns or record})
+            for column, values in zip(grid, mesh):
+                frame[column] = values.ravel()
+            return self.model.predict(frame)
+        X = np.repeat(self.encode([record]), n, axis=0)
+        for column, values in zip(grid, mesh):
+            X[:, self._feature_index(column)] = values.ravel()
+        if self._zeros_missing:
+            X[X == 0] = np.nan
+        return self._predict_encoded(X)
+
+    def _feature_index(self, column):
+        for block in self._blocks:
+            if isinstance(block, _PassthroughBlock) and column in block.columns:
+                return block.start + block.columns.index(column)
+        raise ValueError(f"{column!r} is not a numeric model input")
+
+    def _predict_encoded(self, X):
+        if self._estimator_kind == "xgboost":
+            return self._booster.inplace_predict(
+                X, iteration_range=self._iteration_range, missing=self._estimator.missing,
+                validate_features=False,
+            )
+        if self._estimator_kind == "knn_tree":
+            return self._knn_predict(X)
+        return self._estimator.predict(X)
+
+    def _knn_votes(self, X):
+        """Per-class vote weights (n, classes) and each class's nearest-neighbour distance."""
+        knn = self.model
+        searcher = self.index if self.index is not None else knn._tree
+        distances, indices = searcher.query(X, k=knn.n_neighbors)
+        neighbour_labels = knn._y[indices]
+        if knn.weights == "uniform":
+            weights = np.ones_like(distances)
+        elif knn.weights == "distance":
+            with np.errstate(divide="ignore"):
+                weights = 1.0 / distances
+            exact = np.isinf(weights)
+            weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+        else:
+            return None, None
+        n_classes = len(knn.classes_)
+        rows = np.arange(len(X))[:, None]
+        votes = np.zeros((len(X), n_classes))
+        np.add.at(votes, (rows, neighbour_labels), weights)
+        nearest = np.full((len(X), n_classes), np.inf)
+        np.minimum.at(nearest, (rows, neighbour_labels), distances)
+        return votes, nearest
+
+    def _knn_predict(self, X):
+        votes, _ = self._knn_votes(X)
+        if votes is None:
+            return self.model.predict(pd.DataFrame(X, columns=self.columns))
+        # argmax picks the lowest class index on ties, like scikit-learn's mode
+        return self.model.classes_[votes.argmax(axis=1)]
+
+    def rank_records(self, records, k):
+        """Top-k classes per record with probabilities, from the same neighbour query as predict.
+
+        For the KNN, classes no neighbour voted for are left out, and each entry
+        carries the distance to the nearest training sample of that class.
+        """
+        nearest = None
+        if self.fast and self._estimator_kind == "knn_tree":
+            votes, nearest = self._knn_votes(self.encode(records))
+            if votes is not None:
+                probabilities = votes / votes.sum(axis=1, keepdims=True)
+        if nearest is None:
+            if not hasattr(self.model, "predict_proba"):
+                raise NotImplementedError("model has no class probabilities")
+            probabilities = self.model.predict_proba(pd.DataFrame(records, columns=self.columns or None))
+        classes = self.model.classes_
+        indices, values = top_k(probabilities, k)
+        ranked = []
+        for row, (row_indices, row_values) in enumerate(zip(indices, values)):
+            entries = []
+            for index, probability in zip(row_indices, row_values):
+                if probability <= 0:
+                    break
+                entry = {"label": str(classes[index]), "probability": round(float(probability), 4)}
+                if nearest is not None:
+                    entry["nearest_distance"] = round(float(nearest[row, index]), 4)
+                entries.append(entry)
+            ranked.append(entries)
+        return ranked
+
+    def status(self):
+        status = {"fast_path": self.fast, "fallback_reason": self.fallback_reason}
+        if self.index is not None:
+            status["neighbor_index"] = self.index.status()
+        return status
+
+
+def check_parity(tabular_model, records):
+    """Compare the fast path with the original DataFrame pipeline on the same records."""
+    expected = tabular_model.model.predict(pd.DataFrame(records))
+    actual = tabular_model.predict_records(records)
+    if expected.dtype.kind in "fc":
+        return bool(np.array_equal(np.asarray(expected, dtype=np.float32), np.asarray(actual, dtype=np.float32)))
+    if not np.array_equal(expected, actual):
+        return False
+    if hasattr(tabular_model.model, "predict_proba"):
+        # Ranked output: best class equals predict(), probabilities equal predict_proba()
+        probabilities = tabular_model.model.predict_proba(pd.DataFrame(records))
+        classes = [str(label) for label in tabular_model.model.classes_]
+        for ranked, label, row in zip(tabular_model.rank_records(records, 3), expected, probabilities):
+            if ranked[0]["label"] != str(label) or any(
+                    abs(entry["probability"] - row[classes.index(entry["label"])]) > 1e-4 for entry in ranked):
+                return False
+    return True
+
+
+def check_grid_parity(tabular_model, record, grid):
+    """Compare predict_grid with predicting the expanded records one by one."""
+    mesh = np.meshgrid(*grid.values(), indexing="ij")
+    records = [{**record, **{column: float(values.flat[i]) for column, values in zip(grid, mesh)}}
+               for i in range(mesh[0].size)]
+    expected = tabular_model.predict_records(records)
+    return bool(np.array_equal(np.asarray(expected), np.asarray(tabular_model.predict_grid(record, grid))))
+
+
+def _sample_records(model, n, rng):
+    """Random records covering known categories, unknown categories and zeros."""
+    steps = getattr(model, "steps", None)
+    categories = {}
+    if steps is not None:
+        for _, trans, columns in steps[0][1].transformers_:
+            if type(trans).__name__ == "OneHotEncoder":
+                for column, cats in zip(columns, trans.categories_):
+                    categories[column] = cats.tolist() + ["__unknown__"]
+    records = []
+    for _ in range(n):
+        record = {}
+        for column in model.feature_names_in_:
+            if column in categories:
+                record[column] = categories[column][rng.integers(len(categories[column]))]
+            elif rng.random() < 0.05:
+                record[column] = 0.0
+            else:
+                record[column] = float(np.round(rng.uniform(0, 2000), 3))
+        records.append(record)
+    return records
+
+
+if __name__ == "__main__":
+    import sys
+    import joblib
+
+    rng = np.random.default_rng(0)
+    ok = True
+    for path in sys.argv[1:] or ["Trained_models/CROP_YIELD_MODEL.joblib",
+                                 "Trained_models/Soil_crop_recom.joblib",
+                                 "Trained_models/fertilizer_recommendation_model.joblib"]:
+        try:
+            model = joblib.load(path)
+        except Exception as e:
+            print(f"SKIP {path}: {e}")
+            continue
+        tabular_model = TabularModel(model)
+        if type(model).__name__ == "KNeighborsClassifier":
+            from soil_index import NeighborIndex
+            tabular_model = TabularModel(model, index=NeighborIndex.build(model))
+        records = _sample_records(model, 2000, rng)
+        # Check both a large batch and single-row calls
+        same = check_parity(tabular_model, records) and all(
+            check_parity(tabular_model, [record]) for record in records[:50])
+        numeric = [column for column in model.feature_names_in_ if isinstance(records[0][column], float)]
+        if tabular_model.fast and numeric:
+            # Dense axes, so the XGBoost path scores one value per split interval
+            grid = {column: np.concatenate([[0.0], np.linspace(1, 2000, 150)]) for column in numeric[:2]}
+            same &= check_grid_parity(tabular_model, records[0], grid)
+        ok &= same
+        print(f"{'OK  ' if same else 'FAIL'} {path} fast_path={tabular_model.fast} {tabular_model.fallback_reason or ''}")
+    sys.exit(0 if ok else 1)
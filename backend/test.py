@@ -22,7 +22,7 @@ except ImportError:
 
 from tensorflow.keras.models import load_model # type: ignore
 from tensorflow.keras.preprocessing import image # type: ignore
-from sklearn.preprocessing import MinMaxScaler
+from pricestore import open_store
 
 # --- CONFIGURATION ---
 # Paths to the saved models based on the provided directory structure
@@ -33,6 +33,7 @@ DISEASE_MODEL_PATH = 'Trained_models/CNN/Disease_Detection_model[CNN].h5'
 DISEASE_CLASSES_PATH = 'Trained_models/CNN/disease_classes.npy'
 MARKET_MODEL_PATH = 'Trained_models/lstm_model.keras'
 MARKET_DATA_PATH = 'Datasets/central_india_weekly_crop_prices.csv' # Required for the scaler
+MARKET_STORE_PATH = 'Datasets/price_store/central_india' # Memory-mapped copy of MARKET_DATA_PATH
 
 # Load environment variables for the Weather API
 load_dotenv()
@@ -180,14 +181,14 @@ def forecast_market_prices():
 
     try:
         model = load_model(MARKET_MODEL_PATH)
-        df_historical = pd.read_csv(MARKET_DATA_PATH, index_col='Date', parse_dates=True)
+        prices = open_store(MARKET_STORE_PATH, MARKET_DATA_PATH)
 
         # --- Get User Input ---
         print("Available crops for forecasting:")
-        print(", ".join(df_historical.columns))
+        print(", ".join(prices.columns))
         while True:
             crop_name = input("Enter the crop name you want to forecast: ")
-            if crop_name in df_historical.columns:
+            if crop_name in prices.columns:
                 break
             else:
                 print(f"[Error] Invalid crop name. Please choose from the list above.")
@@ -195,14 +196,13 @@ def forecast_market_prices():
         weeks_to_forecast = get_int_input("Enter the number of weeks to forecast ahead: ")
 
         # --- Scale Data and Predict ---
-        scaler = MinMaxScaler(feature_range=(0, 1))
-        scaled_data = scaler.fit_transform(df_historical)
+        scaler = prices.scaler()
 
         n_steps = 8 # This must match the model's training configuration
-        n_features = df_historical.shape[1]
+        n_features = len(prices.columns)
 
         # Prepare the last known data from the historical dataset as the starting point
-        last_known_data = scaled_data[-n_steps:]
+        last_known_data = scaler.transform(prices.tail(n_steps))
         current_batch = last_known_data.reshape((1, n_steps, n_features))
         forecast = []
 
@@ -216,9 +216,9 @@ def forecast_market_prices():
         forecast_prices = scaler.inverse_transform(forecast)
 
         # Create a DataFrame for the full forecast
-        last_historical_date = df_historical.index[-1]
+        last_historical_date = prices.last_date
         future_dates = pd.to_datetime([last_historical_date + pd.Timedelta(weeks=i) for i in range(1, weeks_to_forecast + 1)])
-        df_forecast = pd.DataFrame(forecast_prices, index=future_dates, columns=df_historical.columns)
+        df_forecast = pd.DataFrame(forecast_prices, index=future_dates, columns=prices.columns)
 
         print(f"\n--- Forecasted Prices for {crop_name} (INR per Quintal) ---")
         # Display only the requested crop's forecast
@@ -0,0 +1,79 @@
+"""Checks that modules imported by main.py still import where fcntl does not exist (Windows).
+
+    python -m unittest test_portability
+"""
+import asyncio  # noqa: F401
+import importlib
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+# Load third-party dependencies normally: only our own modules are re-imported
+# without fcntl, and subprocess would take the fake msvcrt as a sign of Windows
+import numpy  # noqa: F401
+import pandas  # noqa: F401
+import PIL.Image  # noqa: F401
+import sklearn.preprocessing  # noqa: F401
+
+
+def _fake_msvcrt(held):
+    """Stand-in msvcrt whose locking() fails while held["locked"] is set."""
+    msvcrt = types.ModuleType("msvcrt")
+    msvcrt.LK_LOCK, msvcrt.LK_NBLCK, msvcrt.LK_UNLCK = 1, 2, 0
+
+    def locking(fd, mode, nbytes):
+        if held["locked"]:
+            raise OSError("locked")
+
+    msvcrt.locking = locking
+    return msvcrt
+
+
+class WithoutFcntlTest(unittest.TestCase):
+    def setUp(self):
+        self.held = {"locked": False}
+        self.saved = {name: sys.modules.pop(name, None) for name in self.module_names()}
+        # None in sys.modules makes "import fcntl" raise ImportError
+        sys.modules["fcntl"] = None
+        sys.modules["msvcrt"] = _fake_msvcrt(self.held)
+
+    def tearDown(self):
+        # Drop the copies imported without fcntl and put the originals back
+        for name, module in self.saved.items():
+            sys.modules.pop(name, None)
+            if module is not None:
+                sys.modules[name] = module
+
+    def module_names(self):
+        return ["fcntl", "msvcrt", "locks", "jobs", "pricestore"]
+
+    def test_jobs_imports_and_locks(self):
+        jobs = importlib.import_module("jobs")
+        self.assertIsNone(importlib.import_module("locks").fcntl)
+        with tempfile.TemporaryDirectory() as root:
+            store = jobs.JobStore(root)
+            job_id = "0" * 32
+            os.makedirs(store.path(job_id))
+            lock = store.try_lock(job_id)
+            self.assertIsNotNone(lock)
+            lock.close()
+            self.held["locked"] = True
+            self.assertIsNone(store.try_lock(job_id))
+
+    def test_pricestore_rebuilds_changed_csv(self):
+        pricestore = importlib.import_module("pricestore")
+        with tempfile.TemporaryDirectory() as root:
+            csv_path, path = os.path.join(root, "prices.csv"), os.path.join(root, "store")
+            with open(csv_path, "w") as f:
+                f.write("Date,Wheat\n2024-01-01,10\n2024-01-08,11\n")
+            self.assertEqual(len(pricestore.open_store(path, csv_path)), 2)
+            with open(csv_path, "a") as f:
+                f.write("2024-01-15,12\n")
+            # A changed source is rebuilt under the store lock
+            self.assertEqual(len(pricestore.open_store(path, csv_path)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
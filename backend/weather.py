@@ -0,0 +1,119 @@
+import asyncio
+import os
+
+import httpx
+
+from cache import TTLCache
+from metrics import span
+
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org")
+GEOCODE_TTL = float(os.getenv("WEATHER_GEOCODE_TTL", "86400"))  # City coordinates rarely change
+FORECAST_TTL = float(os.getenv("WEATHER_FORECAST_TTL", "600"))  # 3-hour slots, refresh every 10 min
+COORD_PRECISION = 2  # ~1 km; nearby requests share one cached forecast
+
+
+class WeatherClient:
+    """Shared async OpenWeather client with connection pooling, retries and caching.
+
+    Geocode results and forecast payloads are cached with separate TTLs, and
+    concurrent misses for the same key are coalesced into one upstream call.
+    Point base_url at a local stub server to run it without the real API.
+    """
+
+    def __init__(self, api_key, base_url=OPENWEATHER_BASE_URL, timeout=10.0, retries=2,
+                 max_connections=50, geocode_ttl=GEOCODE_TTL, forecast_ttl=FORECAST_TTL):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self.geocode_ttl = geocode_ttl
+        self.forecast_ttl = forecast_ttl
+        self._client = None
+        self._geocode_cache = TTLCache()
+        self._forecast_cache = TTLCache()
+        self._inflight = {}
+        self._stats = {"cache_hits": 0, "cache_misses": 0, "coalesced": 0, "upstream_calls": 0, "retries": 0}
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get_json(self, path, params):
+        params = {**params, "appid": self.api_key}
+        for attempt in range(self.retries + 1):
+            self._stats["upstream_calls"] += 1
+            try:
+                with span("upstream_http"):
+                    response = await self._get_client().get(path, params=params)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()
+                    return response.json()
+                if attempt == self.retries:
+                    response.raise_for_status()
+            self._stats["retries"] += 1
+            await asyncio.sleep(0.2 * 2 ** attempt)
+
+    async def _cached(self, cache, key, ttl, fetch):
+        value = cache.get(key)
+        if value is not None:
+            self._stats["cache_hits"] += 1
+            return value
+        self._stats["cache_misses"] += 1
+
+        task = self._inflight.get(key)
+        if task is None:
+            async def load():
+                result = await fetch()
+                cache.set(key, result, ttl)
+                return result
+
+            task = asyncio.ensure_future(load())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._stats["coalesced"] += 1
+        # Shield so one cancelled request does not cancel the shared upstream call
+        return await asyncio.shield(task)
+
+    async def geocode(self, city):
+        """Return (lat, lon) for a city name, or None if it cannot be found."""
+        key = ("geocode", city.strip().lower())
+        data = await self._cached(
+            self._geocode_cache, key, self.geocode_ttl,
+            lambda: self._get_json("/geo/1.0/direct", {"q": city, "limit": 1}),
+        )
+        if not data:
+            return None
+        return data[0]["lat"], data[0]["lon"]
+
+    async def forecast(self, lat, lon):
+        """Return the 5-day / 3-hour forecast payload for rounded coordinates."""
+        lat, lon = round(lat, COORD_PRECISION), round(lon, COORD_PRECISION)
+        return await self._cached(
+            self._forecast_cache, ("forecast", lat, lon), self.forecast_ttl,
+            lambda: self._get_json("/data/2.5/forecast", {"lat": lat, "lon": lon, "units": "metric"}),
+        )
+
+    def stats(self):
+        return {
+            **self._stats,
+            "geocode_entries": len(self._geocode_cache),
+            "forecast_entries": len(self._forecast_cache),
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,74 @@
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+
+
+def to_columns(payloads):
+    """Flatten the 3-hour slots of several forecast payloads into columnar arrays.
+
+    Each slot's timestamp is shifted by its location's UTC offset
+    (payload["city"]["timezone"]) so days are split at local midnight.
+    """
+    location, local_ts, temp_min, temp_max, humidity, pop, condition = [], [], [], [], [], [], []
+    for index, payload in enumerate(payloads):
+        offset = payload.get("city", {}).get("timezone", 0)
+        for item in payload["list"]:
+            location.append(index)
+            local_ts.append(item["dt"] + offset)
+            temp_min.append(item["main"]["temp_min"])
+            temp_max.append(item["main"]["temp_max"])
+            humidity.append(item["main"]["humidity"])
+            pop.append(item.get("pop", 0))  # Probability of precipitation
+            condition.append(item["weather"][0]["description"])
+    return {
+        "location": np.array(location, dtype=np.int64),
+        "local_ts": np.array(local_ts, dtype=np.int64),
+        "temp_min": np.array(temp_min, dtype=np.float64),
+        "temp_max": np.array(temp_max, dtype=np.float64),
+        "humidity": np.array(humidity, dtype=np.float64),
+        "pop": np.array(pop, dtype=np.float64),
+        "condition": np.array(condition, dtype=object),
+    }
+
+
+def summarize_daily(payloads, days):
+    """Aggregate forecast payloads into per-local-day summaries.
+
+    Returns one list of day summaries per payload, in input order, each
+    limited to the first `days` days. All locations are grouped in a single
+    sort + reduceat pass.
+    """
+    summaries = [[] for _ in payloads]
+    columns = to_columns(payloads)
+    if len(columns["local_ts"]) == 0:
+        return summaries
+
+    local_day = columns["local_ts"] // SECONDS_PER_DAY
+    order = np.lexsort((columns["local_ts"], local_day, columns["location"]))
+    location = columns["location"][order]
+    local_day = local_day[order]
+    starts = np.flatnonzero(np.r_[True, (location[1:] != location[:-1]) | (local_day[1:] != local_day[:-1])])
+    counts = np.diff(np.r_[starts, len(order)])
+
+    min_temp = np.minimum.reduceat(columns["temp_min"][order], starts)
+    max_temp = np.maximum.reduceat(columns["temp_max"][order], starts)
+    avg_humidity = np.add.reduceat(columns["humidity"][order], starts) / counts
+    chance_of_rain = np.add.reduceat(columns["pop"][order], starts) / counts * 100
+    # Condition from the first slot of each local day
+    condition = columns["condition"][order][starts]
+    dates = local_day[starts].astype("datetime64[D]").astype(str)
+
+    for i, start in enumerate(starts):
+        daily = summaries[location[start]]
+        if len(daily) >= days:
+            continue
+        daily.append({
+            "date": str(dates[i]),
+            "min_temp_c": round(float(min_temp[i]), 2),
+            "max_temp_c": round(float(max_temp[i]), 2),
+            "avg_temp_c": round(float(min_temp[i] + max_temp[i]) / 2, 2),  # Approximate average
+            "avg_humidity": round(float(avg_humidity[i]), 2),
+            "chance_of_rain": round(float(chance_of_rain[i]), 2),
+            "condition": condition[i],
+        })
+    return summaries